@@ -1,4 +1,20 @@
 """FastAPI アプリケーションの初期化モジュール。"""
-from .main import create_app
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from .main import create_app
+
+
+def __getattr__(name: str) -> Any:
+    # Discord ボットなど FastAPI を使わないエントリーポイントが
+    # backend.app 配下を import しても FastAPI を読み込まないよう遅延させる
+    if name == "create_app":
+        from .main import create_app
+
+        return create_app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 __all__ = ["create_app"]
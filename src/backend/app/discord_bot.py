@@ -2,27 +2,44 @@
 from __future__ import annotations
 
 import asyncio
+import hashlib
 import io
+import json
 import logging
-from collections.abc import Sequence
-from typing import Optional
+import math
+import os
+import signal
+import subprocess
+import sys
+import time
+from collections.abc import Awaitable, Callable, Mapping, Sequence
+from typing import Any, Optional
 
 import discord
 from discord import app_commands
 from discord.ext import commands
 
-from ..core.config import settings
+from ..core import startup_profile
+from ..core.config import get_settings
+from ..services.attachment_cache import AttachmentBatch, AttachmentCache, AttachmentSource
 from ..services.codex_client import (
     CodexClient,
-    CodexConfig,
     CodexExecutionError,
+    CodexHangError,
     CodexTimeoutError,
+    ResourceUsage,
 )
+from ..services.command_sync_cache import GLOBAL_SCOPE, CommandSyncCache
+from ..services.job_api_client import JobApiCodexClient
+from ..services.output_delivery import DeliveryOptions, OutputStore, plan_delivery
+from ..services.rate_limiter import QuotaScope, RateLimitDecision, RateLimiter, get_rate_limiter
 
 
 LOGGER = logging.getLogger(__name__)
 MESSAGE_LIMIT = 1900  # Discord の 2000 文字制限の手前で分割
 TRIGGER_PREFIX = "!codex"
+ATTACHMENT_ONLY_PROMPT = "添付ファイルの内容を確認してください。"
+RATE_LIMIT_SCOPE_LABELS = {"user": "ユーザー", "channel": "チャンネル"}
 
 
 class CodexDiscordBot(commands.Bot):
@@ -31,34 +48,104 @@ class CodexDiscordBot(commands.Bot):
     def __init__(
         self,
         *,
-        codex_client: CodexClient,
+        codex_client: CodexClient | JobApiCodexClient,
         max_concurrency: int,
         guild_ids: Sequence[int],
         ephemeral: bool,
         auto_channel_ids: Sequence[int],
         context_limit: int,
+        sync_cache: CommandSyncCache | None = None,
+        sync_concurrency: int = 4,
+        delivery: DeliveryOptions | None = None,
+        attachment_dedup_ttl: float = 0.0,
+        rate_limiter: RateLimiter | None = None,
+        attachment_cache: AttachmentCache | None = None,
+        max_input_attachments: int = 5,
+        **options: Any,
     ) -> None:
         intents = discord.Intents.default()
         intents.message_content = True
-        super().__init__(command_prefix=commands.when_mentioned, intents=intents)
+        super().__init__(command_prefix=commands.when_mentioned, intents=intents, **options)
         self._codex_client = codex_client
         self._semaphore = asyncio.Semaphore(max_concurrency)
         self._ephemeral = ephemeral
         self._guild_ids = [discord.Object(id=guild_id) for guild_id in guild_ids]
         self._auto_channel_ids = {int(channel_id) for channel_id in auto_channel_ids}
         self._context_limit = max(0, int(context_limit))
+        self._sync_cache = sync_cache
+        self._sync_concurrency = max(1, int(sync_concurrency))
+        self._delivery = delivery or DeliveryOptions(message_limit=MESSAGE_LIMIT)
+        self._attachment_dedup_ttl = attachment_dedup_ttl
+        # 内容ハッシュ -> (アップロード済み添付 URL, 再利用期限)
+        self._uploaded_attachments: dict[str, tuple[str, float]] = {}
+        self._rate_limiter = rate_limiter
+        # 制限中の対象 -> 次に通知してよい時刻 (連投のたびに返信しないため)
+        self._rate_limit_notices: dict[str, float] = {}
+        self._attachment_cache = attachment_cache
+        self._max_input_attachments = max(0, int(max_input_attachments))
 
     async def setup_hook(self) -> None:  # noqa: D401
-        """Slash Command を対象ギルドに同期する。"""
+        """Slash Command を同期する。前回同期時からツリーが変わっていない対象は省略する。"""
+        shard_ids = getattr(self, "shard_ids", None)
+        if shard_ids is not None and 0 not in shard_ids:
+            # 複数プロセスでシャードを分担する場合、同期はシャード 0 を持つプロセスだけが行う
+            startup_profile.mark("discord setup_hook done")
+            return
+
+        semaphore = asyncio.Semaphore(self._sync_concurrency)
         if not self._guild_ids:
-            await self.tree.sync()
-            LOGGER.info("synced global application commands")
+            await self._sync_commands(None, semaphore)
+        else:
+            for guild in self._guild_ids:
+                self.tree.copy_global_to(guild=guild)
+            await asyncio.gather(
+                *(self._sync_commands(guild, semaphore) for guild in self._guild_ids)
+            )
+
+        if self._sync_cache is not None:
+            try:
+                await asyncio.to_thread(self._sync_cache.save)
+            except (OSError, ValueError):
+                LOGGER.warning("failed to save command sync cache", exc_info=True)
+        startup_profile.mark("discord setup_hook done")
+
+    async def _sync_commands(
+        self, guild: discord.abc.Snowflake | None, semaphore: asyncio.Semaphore
+    ) -> None:
+        scope = GLOBAL_SCOPE if guild is None else str(guild.id)
+        label = "global" if guild is None else f"guild {guild.id}"
+        digest = self._command_tree_digest(guild)
+        if (
+            self._sync_cache is not None
+            and self.application_id is not None
+            and self._sync_cache.get(self.application_id, scope) == digest
+        ):
+            LOGGER.info("application commands unchanged; skipped sync (%s)", label)
             return
 
-        for guild in self._guild_ids:
-            self.tree.copy_global_to(guild=guild)
-            await self.tree.sync(guild=guild)
-            LOGGER.info("synced application commands to guild %s", guild.id)
+        # 429 は discord.py が retry_after だけ待って再送する。並行数はセマフォで抑える
+        async with semaphore:
+            try:
+                await self.tree.sync(guild=guild)
+            except discord.HTTPException:
+                LOGGER.warning("failed to sync application commands (%s)", label, exc_info=True)
+                return
+        LOGGER.info("synced application commands (%s)", label)
+
+        if self._sync_cache is not None and self.application_id is not None:
+            self._sync_cache.set(self.application_id, scope, digest)
+
+    def _command_tree_digest(self, guild: discord.abc.Snowflake | None) -> str:
+        payloads = sorted(
+            json.dumps(command.to_dict(self.tree), sort_keys=True, ensure_ascii=False)
+            for command in self.tree.get_commands(guild=guild)
+        )
+        return hashlib.sha256("\n".join(payloads).encode("utf-8")).hexdigest()
+
+    async def close(self) -> None:
+        await super().close()
+        if isinstance(self._codex_client, JobApiCodexClient):
+            await self._codex_client.close()
 
     async def cog_load(self) -> None:  # pragma: no cover - discord.py lifecycle hook stub
         return None
@@ -72,31 +159,51 @@ class CodexDiscordBot(commands.Bot):
 
         prompt = self._extract_prompt_from_message(message)
         triggered = prompt is not None
+        attachments = list(message.attachments)
 
         reference = message.reference
         if triggered and prompt == "" and reference and reference.message_id:
-            prompt = await self._resolve_reference_prompt(message)
-            if prompt is None:
+            referenced = await self._resolve_reference_message(message)
+            if referenced is None:
                 await self.process_commands(message)
                 return
+            prompt = (referenced.content or "").strip()
+            attachments = [*referenced.attachments, *attachments]
 
-        if triggered and prompt:
-            context_entries = await self._collect_context(message)
-            final_prompt = self._compose_prompt(
-                prompt=prompt,
-                context_entries=context_entries,
-                channel=message.channel,
-            )
-            async with message.channel.typing():
-                result, error = await self._execute_prompt(
-                    final_prompt,
-                    log_context=f"message:{message.id} user:{message.author.id}",
-                )
+        # 本文のない明示的なトリガー (プレフィックスやメンションのみ) で添付があれば、添付を読ませる
+        if triggered and not prompt and attachments:
+            prompt = ATTACHMENT_ONLY_PROMPT
 
-            if error:
-                await message.reply(error, mention_author=False)
+        if triggered and prompt:
+            subjects = self._quota_subjects(message.author.id, getattr(message.channel, "id", None))
+            rejection = await self._check_quota(subjects)
+            if rejection is not None:
+                await self._notify_rate_limited(message, subjects, rejection)
             else:
-                await self._send_message_response(message, result)
+                context_entries, attachment_batch = await asyncio.gather(
+                    self._collect_context(message),
+                    self._ingest_attachments(attachments),
+                )
+                final_prompt = self._compose_prompt(
+                    prompt=prompt,
+                    context_entries=context_entries,
+                    channel=message.channel,
+                    attachments=attachment_batch,
+                )
+                try:
+                    async with message.channel.typing():
+                        result, error = await self._execute_prompt(
+                            final_prompt,
+                            log_context=f"message:{message.id} user:{message.author.id}",
+                            quota_subjects=subjects,
+                        )
+                finally:
+                    self._release_attachments(attachment_batch)
+
+                if error:
+                    await message.reply(error, mention_author=False)
+                else:
+                    await self._send_message_response(message, result)
 
         elif triggered and not prompt:
             await message.reply("プロンプトを入力してください。", mention_author=False)
@@ -106,6 +213,7 @@ class CodexDiscordBot(commands.Bot):
     def _extract_prompt_from_message(self, message: discord.Message) -> str | None:
         content = (message.content or "").strip()
         if not content:
+            # 添付だけのメッセージでは起動しない (自動応答チャンネルでも画像の投稿などで実行しない)
             return None
 
         channel_id = getattr(message.channel, "id", None)
@@ -157,26 +265,72 @@ class CodexDiscordBot(commands.Bot):
             return []
         return context
 
+    async def _ingest_attachments(self, attachments: Sequence[discord.Attachment]) -> AttachmentBatch:
+        """添付をキャッシュへ取り込む。プロンプトにはキャッシュ上のパスだけを載せる。"""
+        batch = AttachmentBatch()
+        if not attachments:
+            return batch
+        if self._attachment_cache is None or self._max_input_attachments == 0:
+            batch.skipped.extend(
+                (attachment.filename, "attachments are disabled") for attachment in attachments
+            )
+            return batch
+
+        accepted = attachments[: self._max_input_attachments]
+        fetched = await self._attachment_cache.fetch_many(
+            [
+                AttachmentSource(
+                    source_id=str(attachment.id),
+                    filename=attachment.filename,
+                    size=attachment.size,
+                    download=attachment.read,
+                )
+                for attachment in accepted
+            ]
+        )
+        fetched.skipped.extend(
+            (attachment.filename, f"more than {self._max_input_attachments} attachments")
+            for attachment in attachments[self._max_input_attachments :]
+        )
+        return fetched
+
+    def _release_attachments(self, batch: AttachmentBatch) -> None:
+        """実行が終わった添付をキャッシュの削除対象へ戻す。"""
+        if self._attachment_cache is not None:
+            self._attachment_cache.release(batch)
+
     def _compose_prompt(
         self,
         *,
         prompt: str,
         context_entries: list[tuple[str, str]],
         channel: discord.abc.MessageableChannel | None,
+        attachments: AttachmentBatch | None = None,
     ) -> str:
-        if not context_entries:
+        has_attachments = attachments is not None and bool(attachments.files or attachments.skipped)
+        if not context_entries and not has_attachments:
             return prompt
 
-        channel_name = getattr(channel, "name", None) or getattr(channel, "id", "channel")
-        lines = [f"# Conversation context from {channel_name}"]
-        for author, content in context_entries:
-            lines.append(f"- {author}: {content}")
-        lines.append("")
+        lines: list[str] = []
+        if context_entries:
+            channel_name = getattr(channel, "name", None) or getattr(channel, "id", "channel")
+            lines.append(f"# Conversation context from {channel_name}")
+            for author, content in context_entries:
+                lines.append(f"- {author}: {content}")
+            lines.append("")
+        if attachments is not None and has_attachments:
+            lines.append("# Attached files")
+            lines.append("The user attached these files. Read them from the local paths below.")
+            for file in attachments.files:
+                lines.append(f"- {file.filename} ({file.size} bytes): {file.path}")
+            for filename, reason in attachments.skipped:
+                lines.append(f"- {filename}: not available ({reason})")
+            lines.append("")
         lines.append("# User request")
         lines.append(prompt)
         return "\n".join(lines)
 
-    async def _resolve_reference_prompt(self, message: discord.Message) -> str | None:
+    async def _resolve_reference_message(self, message: discord.Message) -> discord.Message | None:
         reference = message.reference
         if reference is None or reference.message_id is None:
             return None
@@ -199,97 +353,256 @@ class CodexDiscordBot(commands.Bot):
                 await message.reply("返信先のメッセージ取得に失敗しました。", mention_author=False)
                 return None
 
-        prompt = (referenced.content or "").strip()
-        if not prompt:
-            await message.reply("返信先のメッセージにテキストがありません。", mention_author=False)
+        if not (referenced.content or "").strip() and not referenced.attachments:
+            await message.reply(
+                "返信先のメッセージにテキストや添付ファイルがありません。", mention_author=False
+            )
             return None
-        return prompt
+        return referenced
+
+    async def handle_prompt(
+        self,
+        interaction: discord.Interaction,
+        prompt: str,
+        attachments: Sequence[discord.Attachment] = (),
+    ) -> None:
+        subjects = self._quota_subjects(interaction.user.id, interaction.channel_id)
+        rejection = await self._check_quota(subjects)
+        if rejection is not None:
+            await interaction.response.send_message(
+                self._rate_limit_message(rejection), ephemeral=True
+            )
+            return
 
-    async def handle_prompt(self, interaction: discord.Interaction, prompt: str) -> None:
         await interaction.response.defer(thinking=True, ephemeral=self._ephemeral)
-        result, error = await self._execute_prompt(
-            prompt,
-            log_context=f"interaction:{interaction.id} user:{interaction.user.id}",
+        attachment_batch = await self._ingest_attachments(attachments)
+        final_prompt = self._compose_prompt(
+            prompt=prompt,
+            context_entries=[],
+            channel=interaction.channel,
+            attachments=attachment_batch,
         )
+        try:
+            result, error = await self._execute_prompt(
+                final_prompt,
+                log_context=f"interaction:{interaction.id} user:{interaction.user.id}",
+                quota_subjects=subjects,
+            )
+        finally:
+            self._release_attachments(attachment_batch)
         if error:
             await interaction.followup.send(error, ephemeral=self._ephemeral)
             return
         await self._send_interaction_response(interaction, result)
 
-    async def _execute_prompt(self, prompt: str, *, log_context: str) -> tuple[Optional[str], Optional[str]]:
+    def _quota_subjects(self, user_id: int, channel_id: int | None) -> dict[QuotaScope, str]:
+        subjects: dict[QuotaScope, str] = {"user": str(user_id)}
+        if channel_id is not None:
+            subjects["channel"] = str(channel_id)
+        return subjects
+
+    async def _check_quota(self, subjects: Mapping[QuotaScope, str]) -> RateLimitDecision | None:
+        """Codex の実行前に制限を確認する。受け付けられない場合は判定結果を返す。"""
+        if self._rate_limiter is None:
+            return None
+        decision = await self._rate_limiter.acquire(subjects)
+        if decision.allowed:
+            return None
+        LOGGER.info(
+            "rate limited (%s %s, %s): retry after %.1fs",
+            decision.scope,
+            subjects.get(decision.scope) if decision.scope else None,
+            decision.kind,
+            decision.retry_after,
+        )
+        return decision
+
+    def _rate_limit_message(self, decision: RateLimitDecision) -> str:
+        scope = RATE_LIMIT_SCOPE_LABELS.get(decision.scope or "", "")
+        seconds = max(1, math.ceil(decision.retry_after))
+        if decision.kind == "cpu":
+            return f"この{scope}の Codex 実行時間の上限に達しました。{seconds} 秒後に再試行してください。"
+        return f"この{scope}からのリクエストが多すぎます。{seconds} 秒後に再試行してください。"
+
+    async def _notify_rate_limited(
+        self,
+        message: discord.Message,
+        subjects: Mapping[QuotaScope, str],
+        decision: RateLimitDecision,
+    ) -> None:
+        """制限中の通知は対象ごとに解除されるまで 1 回だけ返信する。"""
+        now = time.monotonic()
+        key = f"{decision.scope}:{subjects.get(decision.scope) if decision.scope else ''}"
+        if self._rate_limit_notices.get(key, 0.0) > now:
+            return
+        self._rate_limit_notices = {
+            notice: until for notice, until in self._rate_limit_notices.items() if until > now
+        }
+        self._rate_limit_notices[key] = now + decision.retry_after
+        await message.reply(self._rate_limit_message(decision), mention_author=False)
+
+    async def _execute_prompt(
+        self,
+        prompt: str,
+        *,
+        log_context: str,
+        quota_subjects: Mapping[QuotaScope, str] | None = None,
+    ) -> tuple[Optional[str], Optional[str]]:
+        text: Optional[str] = None
+        error: Optional[str] = None
+        usage: ResourceUsage | None = None
         async with self._semaphore:
             LOGGER.info("received prompt (%s)", log_context)
             try:
-                result = await self._codex_client.run(prompt)
+                run_result = await self._codex_client.run_with_usage(prompt)
+                text, usage = run_result.text, run_result.usage
+            except CodexHangError as exc:
+                LOGGER.warning("codex hang: %s (%s)", exc, log_context)
+                error = f"Codex が {exc.timeout:.1f} 秒間応答を出力しなかったため停止しました。"
+                usage = exc.usage
             except CodexTimeoutError as exc:
                 LOGGER.warning("codex timeout: %s (%s)", exc, log_context)
-                return None, f"Codex が {exc.timeout:.1f} 秒以内に応答しませんでした。"
+                error = f"Codex が {exc.timeout:.1f} 秒以内に応答しませんでした。"
+                usage = exc.usage
             except CodexExecutionError as exc:
                 LOGGER.exception("codex execution failed (%s)", log_context)
-                return None, f"Codex 実行中にエラーが発生しました: {exc}"
-        return result, None
+                error = f"Codex 実行中にエラーが発生しました: {exc}"
+                usage = exc.usage
+        if usage is not None:
+            LOGGER.info("codex resource usage %s (%s)", usage.as_dict(), log_context)
+            # 失敗・タイムアウトした実行の CPU 時間もクォータから差し引く
+            if self._rate_limiter is not None and quota_subjects:
+                await self._rate_limiter.charge_cpu(quota_subjects, usage.cpu_time)
+        return text, error
 
     async def _send_interaction_response(self, interaction: discord.Interaction, result: str) -> None:
+        async def send(**kwargs: Any) -> discord.WebhookMessage | None:
+            return await interaction.followup.send(ephemeral=self._ephemeral, **kwargs)
+
+        await self._deliver(result, send)
+
+    async def _send_message_response(self, message: discord.Message, result: str) -> None:
+        async def send(**kwargs: Any) -> discord.Message:
+            return await message.reply(mention_author=False, **kwargs)
+
+        await self._deliver(result, send)
+
+    async def _deliver(
+        self, result: str, send: Callable[..., Awaitable[discord.Message | None]]
+    ) -> None:
+        """出力の大きさに応じて分割送信・添付・リンクのいずれかで届ける。"""
         content = result.strip()
         if not content:
-            await interaction.followup.send("Codex から応答がありませんでした。", ephemeral=self._ephemeral)
+            await send(content="Codex から応答がありませんでした。")
             return
 
-        if len(content) <= MESSAGE_LIMIT:
-            await interaction.followup.send(content, ephemeral=self._ephemeral)
+        plan = await asyncio.to_thread(plan_delivery, content, self._delivery)
+        if plan.kind == "messages":
+            for part in plan.messages:
+                await send(content=part)
             return
 
-        buffer = io.BytesIO(content.encode("utf-8"))
-        file = discord.File(buffer, filename="codex-output.txt")
-        await interaction.followup.send(
-            "出力が長いためファイルとして送信します。",
-            file=file,
-            ephemeral=self._ephemeral,
-        )
-
-    async def _send_message_response(self, message: discord.Message, result: str) -> None:
-        content = result.strip()
-        if not content:
-            await message.reply("Codex から応答がありませんでした。", mention_author=False)
+        if plan.kind == "link":
+            minutes = self._delivery.link_ttl / 60
+            await send(
+                content=f"出力が大きいためダウンロードリンクを発行しました (有効期限 {minutes:.0f} 分): {plan.url}"
+            )
             return
 
-        if len(content) <= MESSAGE_LIMIT:
-            await message.reply(content, mention_author=False)
+        assert plan.attachment is not None
+        attachment = plan.attachment
+        now = time.monotonic()
+        cached = self._uploaded_attachments.get(attachment.digest)
+        if cached is not None and cached[1] > now:
+            await send(content=f"同じ内容の出力を送信済みです: {cached[0]}")
             return
 
-        buffer = io.BytesIO(content.encode("utf-8"))
-        file = discord.File(buffer, filename="codex-output.txt")
-        await message.reply(
-            "出力が長いためファイルとして送信します。",
-            file=file,
-            mention_author=False,
+        file = discord.File(io.BytesIO(attachment.data), filename=attachment.filename)
+        sent = await send(content="出力が長いためファイルとして送信します。", file=file)
+        if self._attachment_dedup_ttl > 0 and sent is not None and sent.attachments:
+            self._uploaded_attachments = {
+                digest: entry
+                for digest, entry in self._uploaded_attachments.items()
+                if entry[1] > now
+            }
+            self._uploaded_attachments[attachment.digest] = (
+                sent.attachments[0].url,
+                now + self._attachment_dedup_ttl,
+            )
+
+
+class ShardedCodexDiscordBot(CodexDiscordBot, commands.AutoShardedBot):
+    """複数のゲートウェイ接続 (シャード) を扱う CodexDiscordBot。"""
+
+
+def _create_codex_client() -> CodexClient | JobApiCodexClient:
+    settings = get_settings()
+    if settings.discord_codex_backend_url:
+        # シャードプロセス間で API サーバーのワーカープールと上限を共有する
+        return JobApiCodexClient(
+            settings.discord_codex_backend_url,
+            api_key=settings.discord_codex_backend_api_key,
         )
+    return CodexClient(settings.codex_config())
 
 
-def _create_codex_client() -> CodexClient:
-    config = CodexConfig(
-        command=settings.codex_command,
-        workdir=settings.workdir,
-        timeout=settings.codex_timeout,
-    )
-    return CodexClient(config)
+def _shard_options() -> dict[str, Any]:
+    settings = get_settings()
+    options: dict[str, Any] = {}
+    if settings.discord_shard_count is not None:
+        options["shard_count"] = settings.discord_shard_count
+    if settings.discord_shard_ids is not None:
+        options["shard_ids"] = settings.discord_shard_ids
+    return options
 
 
 def build_bot() -> CodexDiscordBot:
     """設定に基づいてボットを生成する。"""
-    bot = CodexDiscordBot(
+    settings = get_settings()
+    sharded = settings.discord_sharding or bool(_shard_options())
+    bot_class = ShardedCodexDiscordBot if sharded else CodexDiscordBot
+    bot = bot_class(
         codex_client=_create_codex_client(),
         max_concurrency=settings.discord_max_concurrency,
         guild_ids=settings.discord_guild_ids,
         ephemeral=settings.discord_response_ephemeral,
         auto_channel_ids=settings.discord_auto_channel_ids,
         context_limit=settings.discord_context_message_limit,
+        sync_cache=(
+            CommandSyncCache(settings.discord_command_sync_cache)
+            if settings.discord_command_sync_cache is not None
+            else None
+        ),
+        sync_concurrency=settings.discord_sync_concurrency,
+        delivery=DeliveryOptions(
+            message_limit=MESSAGE_LIMIT,
+            max_messages=settings.discord_max_split_messages,
+            compress_threshold=settings.discord_attachment_compress_threshold,
+            upload_limit=settings.discord_upload_limit,
+            store=OutputStore(settings.output_store_dir),
+            public_base_url=settings.public_base_url,
+            link_ttl=settings.output_link_ttl,
+        ),
+        attachment_dedup_ttl=settings.discord_attachment_dedup_ttl,
+        rate_limiter=get_rate_limiter(),
+        attachment_cache=AttachmentCache(
+            settings.input_attachment_cache_dir,
+            max_file_bytes=settings.discord_input_attachment_max_bytes,
+            max_total_bytes=settings.input_attachment_cache_max_bytes,
+            concurrency=settings.discord_input_attachment_concurrency,
+        ),
+        max_input_attachments=settings.discord_input_attachment_max_files,
+        **_shard_options(),
     )
 
     @bot.tree.command(name="codex", description="Codex CLI にプロンプトを送信します。")
-    @app_commands.describe(prompt="Codex に渡すプロンプト")
-    async def codex_command(interaction: discord.Interaction, prompt: str) -> None:
-        await bot.handle_prompt(interaction, prompt)
+    @app_commands.describe(prompt="Codex に渡すプロンプト", file="Codex に読ませるファイル (ログ・diff など)")
+    async def codex_command(
+        interaction: discord.Interaction,
+        prompt: str,
+        file: Optional[discord.Attachment] = None,
+    ) -> None:
+        await bot.handle_prompt(interaction, prompt, [file] if file is not None else [])
 
     return bot
 
@@ -304,14 +617,93 @@ def require_token(token: Optional[str]) -> str:
 
 
 async def run_bot_async() -> None:
-    token = require_token(settings.discord_bot_token)
+    token = require_token(get_settings().discord_bot_token)
     bot = build_bot()
     async with bot:
         await bot.start(token)
 
 
+def run_shard_processes(shard_count: int, processes: int) -> int:
+    """シャードを processes 個の子プロセスへ分配して起動し、いずれかが終了するまで監視する。"""
+
+    def _on_sigterm(signum: int, frame: Any) -> None:
+        # systemd / docker の停止要求でも finally の子プロセス停止を必ず通す
+        raise KeyboardInterrupt
+
+    previous_handler = signal.signal(signal.SIGTERM, _on_sigterm)
+    children: list[subprocess.Popen[bytes]] = []
+    exit_code = 0
+    try:
+        for index in range(processes):
+            shard_ids = list(range(index, shard_count, processes))
+            env = dict(os.environ)
+            env.update(
+                {
+                    "CODEX_WEB_DISCORD_SHARD_COUNT": str(shard_count),
+                    "CODEX_WEB_DISCORD_SHARD_IDS": json.dumps(shard_ids),
+                    "CODEX_WEB_DISCORD_SHARD_PROCESSES": "1",
+                }
+            )
+            LOGGER.info("starting shard process %d with shards %s", index, shard_ids)
+            children.append(
+                subprocess.Popen([sys.executable, "-m", "backend.app.discord_bot"], env=env)
+            )
+
+        while all(child.poll() is None for child in children):
+            time.sleep(1.0)
+        exited = next(child for child in children if child.returncode is not None)
+        exit_code = exited.returncode
+        LOGGER.error("shard process %d exited with code %d", exited.pid, exit_code)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # 停止処理の途中で再度 SIGTERM を受けても子プロセスを取り残さない
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        for child in children:
+            if child.poll() is None:
+                child.terminate()
+        for child in children:
+            try:
+                child.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                child.kill()
+        signal.signal(signal.SIGTERM, previous_handler)
+    return exit_code
+
+
 def main() -> None:
     logging.basicConfig(level=logging.INFO)
+    startup_profile.mark("discord entry point imported")
+    settings = get_settings()
+    shard_count = settings.discord_shard_count
+    if settings.discord_shard_ids is not None:
+        # 空リストだと discord.py は全シャードへ接続し、他プロセスとメッセージを二重処理する
+        if shard_count is None:
+            raise RuntimeError(
+                "CODEX_WEB_DISCORD_SHARD_IDS を使う場合は "
+                "CODEX_WEB_DISCORD_SHARD_COUNT も設定してください。"
+            )
+        if not settings.discord_shard_ids or any(
+            not 0 <= shard_id < shard_count for shard_id in settings.discord_shard_ids
+        ):
+            raise RuntimeError(
+                "CODEX_WEB_DISCORD_SHARD_IDS には 0 以上 "
+                "CODEX_WEB_DISCORD_SHARD_COUNT 未満の ID を 1 つ以上指定してください。"
+            )
+    if settings.discord_shard_processes > 1:
+        if shard_count is None:
+            raise RuntimeError(
+                "CODEX_WEB_DISCORD_SHARD_PROCESSES を使う場合は "
+                "CODEX_WEB_DISCORD_SHARD_COUNT も設定してください。"
+            )
+        if settings.discord_shard_processes > shard_count:
+            # 余ったプロセスは担当シャードが空になり、全シャードへ接続してしまう
+            raise RuntimeError(
+                "CODEX_WEB_DISCORD_SHARD_PROCESSES は "
+                "CODEX_WEB_DISCORD_SHARD_COUNT 以下にしてください。"
+            )
+        require_token(settings.discord_bot_token)
+        sys.exit(run_shard_processes(shard_count, settings.discord_shard_processes))
     asyncio.run(run_bot_async())
 
 
@@ -1,21 +1,71 @@
 """FastAPI アプリケーションのエントリーポイント。"""
+import asyncio
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager, suppress
+
 from fastapi import FastAPI
 
-from .routers import sessions
-from ..core.config import settings
+from .routers import jobs, outputs, sessions
+from ..core import startup_profile
+from ..core.config import get_settings
+from ..core.job_store import shutdown_job_store
+from ..core.session_store import get_codex_client
+from ..services.session_logger import get_session_logger
+
+
+@asynccontextmanager
+async def _lifespan(app: FastAPI) -> AsyncIterator[None]:
+    settings = get_settings()
+    compaction_task: asyncio.Task[None] | None = None
+    if settings.session_log_compaction_interval > 0:
+        compaction_task = asyncio.create_task(
+            get_session_logger().run_compaction(
+                settings.session_log_compaction_interval,
+                compact_after_days=settings.session_log_compact_after_days,
+                retention_days=settings.session_log_retention_days,
+            )
+        )
+    startup_profile.mark("api ready (/health)")
+    try:
+        yield
+    finally:
+        if compaction_task is not None:
+            compaction_task.cancel()
+            with suppress(asyncio.CancelledError):
+                await compaction_task
+        await shutdown_job_store()
 
 
 def create_app() -> FastAPI:
     """FastAPI アプリのインスタンスを生成する。"""
-    app = FastAPI(title="Codex Web Console", version=settings.version)
+    app = FastAPI(
+        title="Codex Web Console",
+        version=get_settings().version,
+        lifespan=_lifespan,
+    )
 
     app.include_router(sessions.router, prefix="/sessions", tags=["sessions"])
+    app.include_router(jobs.router, prefix="/jobs", tags=["jobs"])
+    app.include_router(outputs.router, prefix="/outputs", tags=["outputs"])
 
     @app.get("/health", tags=["health"])
     async def healthcheck() -> dict[str, str]:
         return {"status": "ok"}
 
+    @app.get("/metrics", tags=["health"])
+    async def metrics() -> dict[str, float | int]:
+        """Codex 実行の累積資源使用量を返す。"""
+        totals = get_codex_client().usage_totals()
+        return {
+            "codex_runs": totals.runs,
+            "codex_user_cpu_seconds": round(totals.user_cpu, 3),
+            "codex_system_cpu_seconds": round(totals.system_cpu, 3),
+            "codex_wall_seconds": round(totals.wall_time, 3),
+            "codex_peak_rss_kb": totals.peak_rss_kb,
+        }
+
     return app
 
 
 app = create_app()
+startup_profile.mark("api app created")
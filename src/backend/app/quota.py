@@ -0,0 +1,51 @@
+"""Codex を起動する API リクエストをレート制限・CPU 時間クォータで事前に弾く。"""
+import hashlib
+import hmac
+import math
+
+from fastapi import Header, HTTPException, Request
+
+from ..core.config import get_settings
+from ..services.rate_limiter import RateLimiter
+
+API_KEY_HEADER = "X-API-Key"
+
+
+def get_api_client_key(
+    request: Request,
+    x_api_key: str | None = Header(None, alias=API_KEY_HEADER),
+) -> str:
+    """クォータを数える単位。登録済みの API キーでなければ接続元アドレスで数える。
+
+    任意のキーを受け入れると、キーを変えるだけで制限を回避できてしまうため。
+    """
+    if x_api_key and _is_registered_key(x_api_key):
+        # 状態ファイルにキーそのものを残さない
+        return "key:" + hashlib.sha256(x_api_key.encode("utf-8")).hexdigest()[:32]
+    host = request.client.host if request.client is not None else "unknown"
+    return f"addr:{host}"
+
+
+def _is_registered_key(api_key: str) -> bool:
+    presented = api_key.encode("utf-8")
+    return any(
+        hmac.compare_digest(presented, registered.encode("utf-8"))
+        for registered in get_settings().api_keys
+    )
+
+
+async def enforce_api_quota(limiter: RateLimiter, client_key: str, cost: int = 1) -> None:
+    """制限を超えていれば Retry-After 付きの 429 を送出する。"""
+    decision = await limiter.acquire({"api_key": client_key}, cost)
+    if decision.allowed:
+        return
+    detail = (
+        "cpu time quota exhausted"
+        if decision.kind == "cpu"
+        else "rate limit exceeded"
+    )
+    raise HTTPException(
+        status_code=429,
+        detail=detail,
+        headers={"Retry-After": str(max(1, math.ceil(decision.retry_after)))},
+    )
@@ -1,4 +1,4 @@
 """API ルータを束ねるパッケージ。"""
-from . import sessions
+from . import jobs, outputs, sessions
 
-__all__ = ["sessions"]
+__all__ = ["jobs", "outputs", "sessions"]
@@ -0,0 +1,117 @@
+"""Codex 実行をジョブとして投入・ポーリングする API ルータ。"""
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+
+from ..quota import enforce_api_quota, get_api_client_key
+from ...core.job_store import InMemoryJobStore, Job, JobQueueFullError, get_job_store
+from ...models.job import (
+    JobBatchRequest,
+    JobBatchResponse,
+    JobCreateRequest,
+    JobResultResponse,
+    JobStatusResponse,
+    JobUsage,
+)
+from ...services.rate_limiter import RateLimiter, get_rate_limiter
+
+router = APIRouter()
+
+LONG_POLL_MAX_SECONDS = 60.0
+
+
+def _to_status(job: Job) -> JobStatusResponse:
+    return JobStatusResponse(
+        job_id=job.job_id,
+        state=job.state,
+        created_at=job.created_at,
+        started_at=job.started_at,
+        finished_at=job.finished_at,
+    )
+
+
+@router.post("", response_model=JobStatusResponse, status_code=202)
+async def submit_job(
+    payload: JobCreateRequest,
+    response: Response,
+    client_key: str = Depends(get_api_client_key),
+    store: InMemoryJobStore = Depends(get_job_store),
+    limiter: RateLimiter = Depends(get_rate_limiter),
+) -> JobStatusResponse:
+    """ジョブを投入し、完了を待たずにジョブ ID を返す。"""
+    await enforce_api_quota(limiter, client_key)
+    try:
+        job = await store.submit(payload.text, client_key=client_key)
+    except JobQueueFullError as exc:
+        raise HTTPException(status_code=429, detail=str(exc)) from exc
+    response.headers["Location"] = f"/jobs/{job.job_id}"
+    response.headers["ETag"] = job.etag
+    return _to_status(job)
+
+
+@router.post(":batch", response_model=JobBatchResponse, status_code=202)
+async def submit_jobs_batch(
+    payload: JobBatchRequest,
+    client_key: str = Depends(get_api_client_key),
+    store: InMemoryJobStore = Depends(get_job_store),
+    limiter: RateLimiter = Depends(get_rate_limiter),
+) -> JobBatchResponse:
+    """複数のジョブを一括で投入する。上限超過時は 1 件も投入しない。"""
+    await enforce_api_quota(limiter, client_key, cost=len(payload.jobs))
+    try:
+        jobs = await store.submit_many(
+            [item.text for item in payload.jobs], client_key=client_key
+        )
+    except JobQueueFullError as exc:
+        raise HTTPException(status_code=429, detail=str(exc)) from exc
+    return JobBatchResponse(jobs=[_to_status(job) for job in jobs])
+
+
+@router.get(
+    "/{job_id}",
+    response_model=JobStatusResponse,
+    responses={304: {"description": "ETag から状態が変化していない"}},
+)
+async def get_job_status(
+    job_id: UUID,
+    response: Response,
+    wait: float = Query(
+        0.0,
+        ge=0.0,
+        le=LONG_POLL_MAX_SECONDS,
+        description="If-None-Match と一致する間、状態変化を待つ最大秒数 (long-poll)",
+    ),
+    if_none_match: str | None = Header(None),
+    store: InMemoryJobStore = Depends(get_job_store),
+) -> JobStatusResponse | Response:
+    """ジョブの状態を返す。`wait` 指定時は状態が変わるまで待機する。"""
+    job = await store.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job not found")
+
+    job = await store.wait_for_change(job, if_none_match, wait)
+    if if_none_match is not None and if_none_match == job.etag:
+        return Response(status_code=304, headers={"ETag": job.etag})
+
+    response.headers["ETag"] = job.etag
+    return _to_status(job)
+
+
+@router.get("/{job_id}/result", response_model=JobResultResponse)
+async def get_job_result(
+    job_id: UUID,
+    store: InMemoryJobStore = Depends(get_job_store),
+) -> JobResultResponse:
+    """完了したジョブの結果を返す。未完了の場合は 409。"""
+    job = await store.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    if not job.finished:
+        raise HTTPException(status_code=409, detail=f"job is {job.state}")
+    return JobResultResponse(
+        job_id=job.job_id,
+        state=job.state,
+        output=job.output,
+        error=job.error,
+        usage=JobUsage(**job.usage.as_dict()) if job.usage is not None else None,
+    )
@@ -0,0 +1,26 @@
+"""添付上限を超えた Codex 出力を期限付きリンクで配信する API ルータ。"""
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import FileResponse
+
+from ...core.config import get_settings
+from ...services.output_delivery import OutputStore
+
+router = APIRouter()
+
+
+def get_output_store() -> OutputStore:
+    return OutputStore(get_settings().output_store_dir)
+
+
+@router.get("/{token}", response_class=FileResponse)
+async def download_output(
+    token: str,
+    store: OutputStore = Depends(get_output_store),
+) -> FileResponse:
+    """リンクが有効な間だけ保存済みの出力を返す。"""
+    resolved = store.resolve(token)
+    if resolved is None:
+        raise HTTPException(status_code=404, detail="output not found or expired")
+    path, filename = resolved
+    media_type = "application/gzip" if filename.endswith(".gz") else "text/plain; charset=utf-8"
+    return FileResponse(path, media_type=media_type, filename=filename)
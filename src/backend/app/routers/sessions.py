@@ -3,6 +3,7 @@ from uuid import UUID
 
 from fastapi import APIRouter, Depends, HTTPException
 
+from ..quota import enforce_api_quota, get_api_client_key
 from ...core.session_store import InMemorySessionStore, get_session_store
 from ...models.session import (
     SessionCancelResponse,
@@ -10,16 +11,18 @@ from ...models.session import (
     SessionInput,
     SessionOutput,
 )
+from ...services.rate_limiter import RateLimiter, get_rate_limiter
 
 router = APIRouter()
 
 
 @router.post("", response_model=SessionCreateResponse)
 async def create_session(
+    client_key: str = Depends(get_api_client_key),
     store: InMemorySessionStore = Depends(get_session_store),
 ) -> SessionCreateResponse:
-    """新しい Codex セッションを生成する。"""
-    session = await store.create_session()
+    """新しい Codex セッションを生成する。CPU 時間は作成したクライアントに計上する。"""
+    session = await store.create_session(client_key=client_key)
     return SessionCreateResponse(session_id=session.session_id)
 
 
@@ -27,12 +30,15 @@ async def create_session(
 async def send_input(
     session_id: UUID,
     payload: SessionInput,
+    client_key: str = Depends(get_api_client_key),
     store: InMemorySessionStore = Depends(get_session_store),
+    limiter: RateLimiter = Depends(get_rate_limiter),
 ) -> SessionOutput:
     """セッションへ入力を送信し、最新の出力スナップショットを返す。"""
     session = await store.get_session(session_id)
     if session is None:
         raise HTTPException(status_code=404, detail="session not found")
+    await enforce_api_quota(limiter, client_key)
 
     result = await store.enqueue_input(session.session_id, payload.text)
     return SessionOutput(session_id=session.session_id, latest_output=result)
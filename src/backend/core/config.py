@@ -1,10 +1,18 @@
-"""アプリケーション設定。"""
+"""アプリケーション設定。
+
+`Settings()` は .env の読み込みを伴うため import 時には構築しない。
+`get_settings()` を呼び出した時点で初めて生成する。
+"""
 from functools import lru_cache
 from pathlib import Path
+from typing import Any
 
-from pydantic import Field
+from pydantic import Field, field_validator, model_validator
 from pydantic_settings import BaseSettings
 
+from ..services.codex_client import CodexConfig
+from ..services.rate_limiter import QuotaPolicy, QuotaScope
+
 
 class Settings(BaseSettings):
     version: str = Field("0.1.0", description="アプリケーションバージョン")
@@ -18,10 +26,136 @@ class Settings(BaseSettings):
         description="codex exec 呼び出しのタイムアウト (秒)",
         ge=1.0,
     )
+    codex_idle_timeout: float | None = Field(
+        default=None,
+        gt=0.0,
+        description="出力が途絶えてからハングとみなすまでの秒数 (未設定で無効)",
+    )
+    codex_kill_grace: float = Field(
+        default=5.0,
+        ge=0.0,
+        description="停止時に SIGTERM から SIGKILL へ切り替えるまでの猶予 (秒)",
+    )
+    codex_adaptive_timeout: bool = Field(
+        default=False,
+        description="過去の実行時間 (p95) から workdir ごとにタイムアウトを調整するか",
+    )
+    codex_timeout_min: float = Field(
+        default=30.0,
+        ge=1.0,
+        description="適応タイムアウトの下限 (秒)",
+    )
+    codex_timeout_max: float = Field(
+        default=600.0,
+        ge=1.0,
+        description="適応タイムアウトの上限 (秒)",
+    )
+    codex_cpu_time_limit: int | None = Field(
+        default=None,
+        ge=1,
+        description="1 回の Codex 実行に許す CPU 時間 (秒, RLIMIT_CPU)",
+    )
+    codex_memory_limit_mb: int | None = Field(
+        default=None,
+        ge=1,
+        description="Codex 実行のメモリ上限 (MiB, cgroup memory.max / なければ RLIMIT_DATA)",
+    )
+    codex_process_limit: int | None = Field(
+        default=None,
+        ge=1,
+        description="Codex 実行のプロセス数上限 (cgroup pids.max, codex_cgroup_parent が必須)",
+    )
+    codex_cgroup_parent: Path | None = Field(
+        default=None,
+        description="実行ごとの cgroup v2 を作成する親ディレクトリ (書き込み権限が必要)",
+    )
     session_log_dir: Path = Field(
         default_factory=lambda: Path.home() / "logs" / "sessions",
         description="セッションログ保存先ディレクトリ",
     )
+    session_log_compact_after_days: int = Field(
+        default=1,
+        ge=1,
+        description="この日数以上前のセッションログを圧縮セグメントへ変換する",
+    )
+    session_log_retention_days: int | None = Field(
+        default=None,
+        ge=1,
+        description="セッションログを保持する日数 (未設定で無期限)",
+    )
+    session_log_compaction_interval: float = Field(
+        default=3600.0,
+        ge=0.0,
+        description="セッションログ圧縮ジョブの実行間隔 (秒, 0 で無効)",
+    )
+    job_worker_count: int = Field(
+        default=2,
+        ge=1,
+        description="ジョブ API で同時に Codex を実行するワーカー数",
+    )
+    job_max_pending: int = Field(
+        default=100,
+        ge=1,
+        description="未処理 (queued/running) ジョブ数の上限",
+    )
+    job_result_ttl: float = Field(
+        default=3600.0,
+        ge=0.0,
+        description="完了したジョブを保持する時間 (秒)",
+    )
+    rate_limit_state_path: Path | None = Field(
+        default=None,
+        description="レート制限の状態を保存する SQLite ファイル (未設定ならプロセス内メモリ)",
+    )
+    rate_limit_user_per_minute: float | None = Field(
+        default=None,
+        gt=0.0,
+        description="Discord ユーザーごとの 1 分あたり実行数 (未設定で無制限)",
+    )
+    rate_limit_user_burst: int = Field(
+        default=3,
+        ge=1,
+        description="Discord ユーザーごとに連続して受け付ける実行数",
+    )
+    rate_limit_channel_per_minute: float | None = Field(
+        default=None,
+        gt=0.0,
+        description="Discord チャンネルごとの 1 分あたり実行数 (未設定で無制限)",
+    )
+    rate_limit_channel_burst: int = Field(
+        default=5,
+        ge=1,
+        description="Discord チャンネルごとに連続して受け付ける実行数",
+    )
+    api_keys: list[str] = Field(
+        default_factory=list,
+        description="個別にクォータを数える X-API-Key のリスト (それ以外は接続元アドレスで数える)",
+    )
+    rate_limit_api_key_per_minute: float | None = Field(
+        default=None,
+        gt=0.0,
+        description="API クライアント (登録済み API キーまたはアドレス) ごとの 1 分あたり実行数",
+    )
+    rate_limit_api_key_burst: int = Field(
+        default=10,
+        ge=1,
+        description="API クライアントごとに連続して受け付ける実行数",
+    )
+    quota_user_cpu_seconds_per_hour: float | None = Field(
+        default=None,
+        gt=0.0,
+        description="Discord ユーザーごとに 1 時間あたり許す Codex の CPU 時間 (秒)",
+    )
+    quota_channel_cpu_seconds_per_hour: float | None = Field(
+        default=None,
+        gt=0.0,
+        description="Discord チャンネルごとに 1 時間あたり許す Codex の CPU 時間 (秒)",
+    )
+    quota_api_key_cpu_seconds_per_hour: float | None = Field(
+        default=None,
+        gt=0.0,
+        description="API クライアントごとに 1 時間あたり許す Codex の CPU 時間 (秒)",
+    )
     discord_bot_token: str | None = Field(
         default=None,
         description="Discord ボットのトークン (CODEX_WEB_DISCORD_BOT_TOKEN)",
@@ -50,6 +184,166 @@ class Settings(BaseSettings):
         le=50,
         description="コンテキストとして参照する直近メッセージ数",
     )
+    discord_sharding: bool = Field(
+        default=False,
+        description="AutoShardedBot で起動するか (シャード数は Discord の推奨値)",
+    )
+    discord_shard_count: int | None = Field(
+        default=None,
+        ge=1,
+        description="全体のシャード数 (設定するとシャーディングを有効化)",
+    )
+    discord_shard_ids: list[int] | None = Field(
+        default=None,
+        description="このプロセスが担当するシャード ID のリスト",
+    )
+    discord_shard_processes: int = Field(
+        default=1,
+        ge=1,
+        description="シャードを分担して起動するプロセス数 (2 以上で子プロセスを起動)",
+    )
+    discord_codex_backend_url: str | None = Field(
+        default=None,
+        description="Codex 実行を委譲するジョブ API の URL (未設定ならプロセス内で実行)",
+    )
+    discord_codex_backend_api_key: str | None = Field(
+        default=None,
+        description="ジョブ API へ送る X-API-Key (API 側の api_keys に登録しておく)",
+    )
+    discord_max_split_messages: int = Field(
+        default=3,
+        ge=1,
+        le=10,
+        description="長い出力を分割して送るメッセージ数の上限 (超える場合は添付)",
+    )
+    discord_attachment_compress_threshold: int = Field(
+        default=1024 * 1024,
+        ge=0,
+        description="添付を gzip 圧縮するサイズの閾値 (バイト)",
+    )
+    discord_upload_limit: int = Field(
+        default=8 * 1024 * 1024,
+        ge=1,
+        description="Discord へ添付できる最大サイズ (バイト)。超える出力はリンクで共有する",
+    )
+    discord_attachment_dedup_ttl: float = Field(
+        default=3600.0,
+        ge=0.0,
+        description="同一内容の添付を再アップロードせず既存 URL を再利用する期間 (秒)",
+    )
+    output_store_dir: Path = Field(
+        default_factory=lambda: Path.home() / ".cache" / "codex-web" / "outputs",
+        description="添付上限を超える出力の保存先",
+    )
+    output_link_ttl: float = Field(
+        default=3600.0,
+        gt=0.0,
+        description="保存した出力へのリンクの有効期間 (秒)",
+    )
+    public_base_url: str | None = Field(
+        default=None,
+        description="API サーバーの公開 URL (出力リンクの生成に使用。未設定なら切り詰めて添付)",
+    )
+    discord_input_attachment_max_files: int = Field(
+        default=5,
+        ge=0,
+        le=10,
+        description="1 回の実行で Codex に渡す添付ファイル数の上限 (0 で添付を無視)",
+    )
+    discord_input_attachment_max_bytes: int = Field(
+        default=8 * 1024 * 1024,
+        ge=1,
+        description="Codex に渡す添付ファイル 1 件あたりの最大サイズ (バイト)",
+    )
+    discord_input_attachment_concurrency: int = Field(
+        default=4,
+        ge=1,
+        description="添付ファイルを並行してダウンロードする数の上限",
+    )
+    input_attachment_cache_dir: Path = Field(
+        default_factory=lambda: Path.home() / ".cache" / "codex-web" / "attachments",
+        description="添付ファイルを内容ハッシュで保存するキャッシュの場所",
+    )
+    input_attachment_cache_max_bytes: int = Field(
+        default=512 * 1024 * 1024,
+        ge=1,
+        description="添付キャッシュの合計サイズ上限 (超えると古いものから削除)",
+    )
+    discord_command_sync_cache: Path | None = Field(
+        default_factory=lambda: Path.home() / ".cache" / "codex-web" / "discord-command-sync.json",
+        description="同期済み Slash Command ツリーのハッシュ保存先 (空文字で無効化し毎回同期)",
+    )
+    discord_sync_concurrency: int = Field(
+        default=4,
+        ge=1,
+        description="Slash Command を並行して同期するギルド数の上限",
+    )
+
+    @field_validator("discord_command_sync_cache", mode="before")
+    @classmethod
+    def _empty_sync_cache_disables(cls, value: Any) -> Any:
+        # 空文字は Path('.') になり保存に失敗するため、キャッシュ無効として扱う
+        if isinstance(value, str) and not value.strip():
+            return None
+        return value
+
+    @model_validator(mode="after")
+    def _check_process_limit(self) -> "Settings":
+        # pids.max でのみ掛けるため、cgroup がないと上限が黙って無視される
+        if self.codex_process_limit is not None and self.codex_cgroup_parent is None:
+            raise ValueError(
+                "CODEX_WEB_CODEX_PROCESS_LIMIT には CODEX_WEB_CODEX_CGROUP_PARENT が必要です"
+            )
+        return self
+
+    def codex_config(self) -> CodexConfig:
+        """Codex CLI 呼び出し設定を組み立てる。"""
+        return CodexConfig(
+            command=self.codex_command,
+            workdir=self.workdir,
+            timeout=self.codex_timeout,
+            idle_timeout=self.codex_idle_timeout,
+            kill_grace=self.codex_kill_grace,
+            adaptive_timeout=self.codex_adaptive_timeout,
+            min_timeout=self.codex_timeout_min,
+            max_timeout=self.codex_timeout_max,
+            cpu_time_limit=self.codex_cpu_time_limit,
+            memory_limit=(
+                self.codex_memory_limit_mb * 1024 * 1024
+                if self.codex_memory_limit_mb is not None
+                else None
+            ),
+            process_limit=self.codex_process_limit,
+            cgroup_parent=self.codex_cgroup_parent,
+        )
+
+    def quota_policies(self) -> dict[QuotaScope, QuotaPolicy]:
+        """スコープごとのレート制限・CPU 時間クォータを組み立てる。"""
+        return {
+            "user": QuotaPolicy(
+                requests_per_minute=self.rate_limit_user_per_minute,
+                burst=self.rate_limit_user_burst,
+                cpu_seconds_per_hour=self.quota_user_cpu_seconds_per_hour,
+            ),
+            "channel": QuotaPolicy(
+                requests_per_minute=self.rate_limit_channel_per_minute,
+                burst=self.rate_limit_channel_burst,
+                cpu_seconds_per_hour=self.quota_channel_cpu_seconds_per_hour,
+            ),
+            "api_key": QuotaPolicy(
+                requests_per_minute=self.rate_limit_api_key_per_minute,
+                burst=self.rate_limit_api_key_burst,
+                cpu_seconds_per_hour=self.quota_api_key_cpu_seconds_per_hour,
+            ),
+        }
+
+    def max_codex_timeout(self) -> float:
+        """適応タイムアウトと停止猶予を含め、1 回の実行が終わるまでの最大秒数。"""
+        timeout = self.codex_timeout
+        if self.codex_adaptive_timeout:
+            timeout = max(timeout, self.codex_timeout_max)
+        # タイムアウト後も SIGKILL までは kill_grace 秒待つ
+        return timeout + self.codex_kill_grace
 
     class Config:
         env_prefix = "CODEX_WEB_"
@@ -62,4 +356,8 @@ def get_settings() -> Settings:
     return Settings()
 
 
-settings = get_settings()
+def __getattr__(name: str) -> Any:
+    # 互換用: `from .config import settings` は参照された時点で設定を構築する
+    if name == "settings":
+        return get_settings()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,237 @@
+"""HTTP リクエストから切り離して Codex を実行するジョブキュー。"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections.abc import Awaitable, Callable, Sequence
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Literal, Optional
+from uuid import UUID, uuid4
+
+from .config import get_settings
+from .session_store import format_usage, get_codex_client
+from ..services.codex_client import (
+    CodexExecutionError,
+    CodexRunResult,
+    CodexTimeoutError,
+    ResourceUsage,
+)
+from ..services.rate_limiter import get_rate_limiter
+from ..services.session_logger import get_session_logger
+
+
+logger = logging.getLogger(__name__)
+
+JobState = Literal["queued", "running", "succeeded", "failed"]
+FINISHED_STATES: frozenset[str] = frozenset({"succeeded", "failed"})
+
+
+class JobQueueFullError(RuntimeError):
+    """未処理ジョブ数が上限に達している場合のエラー。"""
+
+    def __init__(self, limit: int):
+        super().__init__(f"job queue is full ({limit} pending)")
+        self.limit = limit
+
+
+@dataclass
+class Job:
+    job_id: UUID
+    prompt: str
+    state: JobState = "queued"
+    output: str = ""
+    error: str | None = None
+    # CPU 時間クォータを計上する API クライアント
+    client_key: str | None = None
+    # 完了したジョブの資源使用量 (呼び出し側が自分のクォータへ計上できるよう結果で返す)
+    usage: ResourceUsage | None = None
+    created_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+    version: int = 0
+    changed: asyncio.Event = field(default_factory=asyncio.Event, repr=False, compare=False)
+    finished_monotonic: float | None = field(default=None, repr=False, compare=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.state in FINISHED_STATES
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.job_id.hex}-{self.version}"'
+
+    def mark_changed(self) -> None:
+        """状態変更を待機中の long-poll へ通知する。"""
+        self.version += 1
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+
+class InMemoryJobStore:
+    """ワーカープールで Codex ジョブを処理するメモリ内ストア。"""
+
+    def __init__(
+        self,
+        job_runner: Callable[[str], Awaitable[CodexRunResult]],
+        worker_count: int = 1,
+        max_pending: int = 100,
+        result_ttl: float = 3600.0,
+    ):
+        self._job_runner = job_runner
+        self._worker_count = max(1, worker_count)
+        self._max_pending = max_pending
+        self._result_ttl = result_ttl
+        self._jobs: dict[UUID, Job] = {}
+        self._queue: asyncio.Queue[Job] = asyncio.Queue()
+        self._workers: list[asyncio.Task[None]] = []
+        self._pending = 0
+        self._lock = asyncio.Lock()
+
+    async def submit(self, prompt: str, *, client_key: str | None = None) -> Job:
+        jobs = await self.submit_many([prompt], client_key=client_key)
+        return jobs[0]
+
+    async def submit_many(
+        self, prompts: Sequence[str], *, client_key: str | None = None
+    ) -> list[Job]:
+        """ジョブをまとめて投入する。上限を超える場合は 1 件も投入しない。"""
+        async with self._lock:
+            self._ensure_workers()
+            self._prune_expired()
+            if self._pending + len(prompts) > self._max_pending:
+                raise JobQueueFullError(self._max_pending)
+            jobs = [Job(job_id=uuid4(), prompt=prompt, client_key=client_key) for prompt in prompts]
+            for job in jobs:
+                self._jobs[job.job_id] = job
+                self._queue.put_nowait(job)
+            self._pending += len(jobs)
+        for job in jobs:
+            await _write_job_log(job.job_id, "input", job.prompt)
+        return jobs
+
+    async def get_job(self, job_id: UUID) -> Optional[Job]:
+        async with self._lock:
+            return self._jobs.get(job_id)
+
+    async def wait_for_change(self, job: Job, etag: str | None, timeout: float) -> Job:
+        """ETag が一致する間、状態変化か timeout まで待機する (long-poll)。"""
+        if timeout <= 0 or etag is None or etag != job.etag or job.finished:
+            return job
+        try:
+            await asyncio.wait_for(job.changed.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        return job
+
+    async def shutdown(self) -> None:
+        workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+    def _ensure_workers(self) -> None:
+        self._workers = [worker for worker in self._workers if not worker.done()]
+        while len(self._workers) < self._worker_count:
+            self._workers.append(asyncio.create_task(self._worker()))
+
+    def _prune_expired(self) -> None:
+        now = time.monotonic()
+        expired = [
+            job_id
+            for job_id, job in self._jobs.items()
+            if job.finished_monotonic is not None
+            and now - job.finished_monotonic > self._result_ttl
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run_job(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run_job(self, job: Job) -> None:
+        job.state = "running"
+        job.started_at = datetime.now(timezone.utc)
+        job.mark_changed()
+        usage: ResourceUsage | None = None
+        try:
+            result = await self._job_runner(job.prompt)
+            job.output = result.text
+            job.state = "succeeded"
+            usage = result.usage
+        except CodexTimeoutError as exc:
+            logger.warning("codex exec timed out (job %s)", job.job_id)
+            job.error = str(exc)
+            job.state = "failed"
+            usage = exc.usage
+        except CodexExecutionError as exc:
+            logger.exception("codex exec failed (job %s)", job.job_id)
+            job.error = str(exc)
+            job.state = "failed"
+            usage = exc.usage
+        except asyncio.CancelledError:
+            job.error = "job cancelled"
+            job.state = "failed"
+            raise
+        except Exception as exc:  # noqa: BLE001
+            # 想定外の例外でもワーカーを止めず、ジョブを失敗として完了させる
+            logger.exception("unexpected error while running job %s", job.job_id)
+            job.error = f"internal error: {exc}"
+            job.state = "failed"
+        finally:
+            job.usage = usage
+            self._finish(job)
+        if usage is not None:
+            # 失敗・タイムアウトした実行も使った CPU 時間をクォータから差し引く
+            if job.client_key is not None:
+                await get_rate_limiter().charge_cpu({"api_key": job.client_key}, usage.cpu_time)
+            await _write_job_log(job.job_id, "status", format_usage(usage))
+        await _write_job_log(
+            job.job_id, "output", job.output if job.error is None else f"[error] {job.error}"
+        )
+
+    def _finish(self, job: Job) -> None:
+        job.finished_at = datetime.now(timezone.utc)
+        job.finished_monotonic = time.monotonic()
+        self._pending -= 1
+        job.mark_changed()
+
+
+async def codex_job_runner(prompt: str) -> CodexRunResult:
+    return await get_codex_client().run_with_usage(prompt)
+
+
+_job_store: InMemoryJobStore | None = None
+
+
+async def shutdown_job_store() -> None:
+    """ジョブストアが生成済みならワーカーを停止する (アプリ終了時用)。"""
+    if _job_store is not None:
+        await _job_store.shutdown()
+
+
+async def get_job_store() -> InMemoryJobStore:
+    """DI 用のシングルトンジョブストア取得。"""
+    global _job_store
+    if _job_store is None:
+        settings = get_settings()
+        _job_store = InMemoryJobStore(
+            job_runner=codex_job_runner,
+            worker_count=settings.job_worker_count,
+            max_pending=settings.job_max_pending,
+            result_ttl=settings.job_result_ttl,
+        )
+    return _job_store
+
+
+async def _write_job_log(job_id: UUID, stream: str, text: str) -> None:
+    try:
+        await get_session_logger().log_event(job_id, stream, text)
+    except Exception:  # noqa: BLE001
+        logger.exception("failed to append job log")
@@ -2,20 +2,22 @@
 from __future__ import annotations
 
 import asyncio
+import json
 import logging
 from collections.abc import Awaitable, Callable
 from dataclasses import dataclass, field
 from typing import Optional
 from uuid import UUID, uuid4
 
-from .config import settings
 from ..services.codex_client import (
     CodexClient,
-    CodexConfig,
     CodexExecutionError,
+    CodexHangError,
+    CodexRunResult,
     CodexTimeoutError,
+    ResourceUsage,
 )
-from ..services.session_logger import get_session_logger
+from ..services.rate_limiter import get_rate_limiter
 
 
 logger = logging.getLogger(__name__)
@@ -26,6 +28,11 @@ CANCELLED_MESSAGE = "[cancelled] Codex の実行を停止しました。"
 TIMEOUT_MESSAGE_TEMPLATE = (
     "[timeout] Codex の応答が {seconds:.0f} 秒以内に完了しませんでした。"
 )
+HANG_MESSAGE_TEMPLATE = (
+    "[timeout] Codex が {seconds:.0f} 秒間出力しなかったため停止しました。"
+)
+# ランチャー起動などタイムアウト計測外の時間に対する余裕 (秒)
+RESPONSE_TIMEOUT_MARGIN = 15.0
 
 
 @dataclass
@@ -34,7 +41,9 @@ class Session:
     latest_output: str = ""
     queue: asyncio.Queue[str] = field(default_factory=asyncio.Queue)
     response_queue: asyncio.Queue[str] = field(default_factory=asyncio.Queue)
-    current_task: asyncio.Task[str] | None = field(default=None, repr=False, compare=False)
+    current_task: asyncio.Task[CodexRunResult] | None = field(default=None, repr=False, compare=False)
+    # CPU 時間クォータを計上する API クライアント (セッションの作成者)
+    client_key: str | None = None
 
 
 class InMemorySessionStore:
@@ -50,9 +59,9 @@ class InMemorySessionStore:
         self._lock = asyncio.Lock()
         self._response_timeout = response_timeout
 
-    async def create_session(self) -> Session:
+    async def create_session(self, client_key: str | None = None) -> Session:
         async with self._lock:
-            session = Session(session_id=uuid4())
+            session = Session(session_id=uuid4(), client_key=client_key)
             self._sessions[session.session_id] = session
             asyncio.create_task(self._codex_runner(session))
         await _write_session_log(session.session_id, "status", "session created")
@@ -120,13 +129,10 @@ _codex_client: CodexClient | None = None
 def get_codex_client() -> CodexClient:
     global _codex_client
     if _codex_client is None:
-        _codex_client = CodexClient(
-            CodexConfig(
-                command=settings.codex_command,
-                workdir=settings.workdir,
-                timeout=settings.codex_timeout,
-            )
-        )
+        # 設定 (pydantic-settings) の読み込みは初回利用時まで遅延する
+        from .config import get_settings
+
+        _codex_client = CodexClient(get_settings().codex_config())
     return _codex_client
 
 
@@ -137,19 +143,35 @@ async def codex_runner(session: Session) -> str:
         text = await session.queue.get()
         if text == TERMINATE_MESSAGE:
             break
-        session.current_task = asyncio.create_task(client.run(text))
+        session.current_task = asyncio.create_task(client.run_with_usage(text))
+        usage: ResourceUsage | None = None
         try:
-            response = await session.current_task
+            result = await session.current_task
+            response = result.text
+            usage = result.usage
         except asyncio.CancelledError:
             response = CANCELLED_MESSAGE
+        except CodexHangError as exc:
+            logger.warning("codex exec hung", exc_info=True)
+            response = HANG_MESSAGE_TEMPLATE.format(seconds=exc.timeout)
+            usage = exc.usage
         except CodexTimeoutError as exc:
             logger.warning("codex exec timed out", exc_info=True)
             response = TIMEOUT_MESSAGE_TEMPLATE.format(seconds=exc.timeout)
+            usage = exc.usage
         except CodexExecutionError as exc:
             logger.exception("codex exec failed")
             response = f"[codex-error] {exc}"
+            usage = exc.usage
         finally:
             session.current_task = None
+        if usage is not None:
+            # 失敗した実行も資源使用量を記録し、クォータから差し引く
+            if session.client_key is not None:
+                await get_rate_limiter().charge_cpu(
+                    {"api_key": session.client_key}, usage.cpu_time
+                )
+            await _write_session_log(session.session_id, "status", format_usage(usage))
         await _write_session_log(session.session_id, "output", response)
         session.latest_output = response
         await session.response_queue.put(session.latest_output)
@@ -163,14 +185,25 @@ async def get_session_store() -> InMemorySessionStore:
     """DI 用のシングルトンストア取得。"""
     global _session_store
     if _session_store is None:
+        from .config import get_settings
+
+        # タイムアウトの計測はランチャー起動と stdin 書き込みの後から始まるため、
+        # その分の余裕を上乗せして遅れた応答を次の入力へ取り違えないようにする
         _session_store = InMemorySessionStore(
             codex_runner=codex_runner,
-            response_timeout=settings.codex_timeout + 5,
+            response_timeout=get_settings().max_codex_timeout() + RESPONSE_TIMEOUT_MARGIN,
         )
     return _session_store
 
 
+def format_usage(usage: ResourceUsage) -> str:
+    """セッションログ用に資源使用量を 1 行へ整形する。"""
+    return "resource usage " + json.dumps(usage.as_dict())
+
+
 async def _write_session_log(session_id: UUID, stream: str, text: str) -> None:
+    from ..services.session_logger import get_session_logger
+
     try:
         await get_session_logger().log_event(session_id, stream, text)
     except Exception:  # noqa: BLE001
@@ -0,0 +1,171 @@
+"""起動時間の計測とベンチマーク。
+
+環境変数 `CODEX_WEB_STARTUP_PROFILE=1` を設定すると、プロセス起動からの経過時間を
+`mark()` 呼び出しごとに stderr へ出力する (`/health` 応答可能、Discord `setup_hook` 完了など)。
+設定値の構築自体も計測対象なので、有効化の判定は Settings を経由しない。
+
+`python -m backend.core.startup_profile` で import 時間と `/health` 応答までの時間を
+計測し、`--budget-ms` を超えた場合は終了コード 1 を返す (起動時間の回帰検知用)。
+"""
+from __future__ import annotations
+
+import os
+import sys
+import time
+
+ENV_VAR = "CODEX_WEB_STARTUP_PROFILE"
+IMPORT_TARGETS = ("backend.app.main", "backend.app.discord_bot")
+
+
+def _process_age() -> float:
+    """プロセス起動からの経過秒数。/proc が無ければこのモジュールの import 時点を起点にする。"""
+    try:
+        with open("/proc/self/stat", encoding="ascii") as file:
+            fields = file.read().rsplit(")", 1)[1].split()
+        start_ticks = int(fields[19])
+        return time.clock_gettime(time.CLOCK_BOOTTIME) - start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return 0.0
+
+
+_ORIGIN = time.perf_counter() - _process_age()
+_marks: list[tuple[str, float]] = []
+
+
+def enabled() -> bool:
+    return os.environ.get(ENV_VAR, "").lower() in {"1", "true", "yes"}
+
+
+def mark(label: str) -> None:
+    """プロファイル有効時、起動からの経過時間を記録して stderr へ出す。
+
+    uvicorn などがロガー設定を差し替えても確実に見えるよう logging は使わない。
+    """
+    if not enabled():
+        return
+    elapsed_ms = (time.perf_counter() - _ORIGIN) * 1000
+    _marks.append((label, elapsed_ms))
+    print(f"[startup] {label} at {elapsed_ms:.1f} ms", file=sys.stderr, flush=True)
+
+
+def marks() -> list[tuple[str, float]]:
+    return list(_marks)
+
+
+def _measure_import(module: str) -> tuple[float, list[tuple[str, float]]]:
+    """別プロセスで module を import し、累積時間 (ms) と内訳を返す。"""
+    import subprocess
+
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    entries: list[tuple[str, float]] = []
+    total = 0.0
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line.split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2].strip()
+        cumulative_ms = int(parts[1]) / 1000
+        if name == module:
+            total = cumulative_ms
+        else:
+            entries.append((name, cumulative_ms))
+    entries.sort(key=lambda entry: entry[1], reverse=True)
+    return total, entries
+
+
+def _free_port() -> int:
+    import socket
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _measure_health_ready(timeout: float = 30.0) -> float:
+    """uvicorn を起動し、`/health` が 200 を返すまでの時間 (ms) を返す。"""
+    import subprocess
+    import urllib.error
+    import urllib.request
+
+    port = _free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "backend.app.main:app",
+            "--host",
+            "127.0.0.1",
+            "--port",
+            str(port),
+            "--log-level",
+            "warning",
+        ],
+    )
+    url = f"http://127.0.0.1:{port}/health"
+    try:
+        while time.perf_counter() - started < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with code {process.returncode}")
+            try:
+                with urllib.request.urlopen(url, timeout=1) as response:
+                    if response.status == 200:
+                        return (time.perf_counter() - started) * 1000
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.01)
+        raise RuntimeError(f"/health did not become ready within {timeout:.0f}s")
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main(argv: list[str] | None = None) -> int:
+    # ベンチマーク専用の依存は、mark() だけを使う本番経路に読み込ませない
+    import argparse
+    import statistics
+
+    parser = argparse.ArgumentParser(description="起動時間のベンチマーク")
+    parser.add_argument("--runs", type=int, default=5, help="計測回数 (中央値を採用)")
+    parser.add_argument("--top", type=int, default=10, help="表示する import 内訳の件数")
+    parser.add_argument("--budget-ms", type=float, default=None, help="各計測の許容上限 (ms)")
+    parser.add_argument("--skip-health", action="store_true", help="/health 計測を省略する")
+    args = parser.parse_args(argv)
+
+    results: dict[str, float] = {}
+    for module in IMPORT_TARGETS:
+        samples: list[float] = []
+        breakdown: list[tuple[str, float]] = []
+        for _ in range(args.runs):
+            total, breakdown = _measure_import(module)
+            samples.append(total)
+        results[f"import {module}"] = statistics.median(samples)
+        print(f"import {module}: median {statistics.median(samples):.1f} ms")
+        for name, cumulative_ms in breakdown[: args.top]:
+            print(f"    {cumulative_ms:8.1f} ms  {name}")
+
+    if not args.skip_health:
+        samples = [_measure_health_ready() for _ in range(args.runs)]
+        results["/health ready"] = statistics.median(samples)
+        print(f"/health ready: median {statistics.median(samples):.1f} ms")
+
+    if args.budget_ms is None:
+        return 0
+    over = {label: value for label, value in results.items() if value > args.budget_ms}
+    for label, value in over.items():
+        print(f"REGRESSION: {label} took {value:.1f} ms (budget {args.budget_ms:.0f} ms)")
+    return 1 if over else 0
+
+
+if __name__ == "__main__":  # pragma: no cover - CLI entry point
+    sys.exit(main())
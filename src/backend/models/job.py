@@ -0,0 +1,47 @@
+"""ジョブ API 入出力モデル定義。"""
+from datetime import datetime
+from typing import Literal
+from uuid import UUID
+
+from pydantic import BaseModel, Field
+
+JobStateName = Literal["queued", "running", "succeeded", "failed"]
+
+
+class JobCreateRequest(BaseModel):
+    text: str = Field(..., min_length=1, description="Codex CLI への入力")
+
+
+class JobBatchRequest(BaseModel):
+    jobs: list[JobCreateRequest] = Field(
+        ..., min_length=1, max_length=100, description="一括投入するジョブ"
+    )
+
+
+class JobStatusResponse(BaseModel):
+    job_id: UUID = Field(..., description="ジョブ ID")
+    state: JobStateName = Field(..., description="ジョブの状態")
+    created_at: datetime = Field(..., description="投入時刻")
+    started_at: datetime | None = Field(None, description="実行開始時刻")
+    finished_at: datetime | None = Field(None, description="完了時刻")
+
+
+class JobBatchResponse(BaseModel):
+    jobs: list[JobStatusResponse] = Field(..., description="投入したジョブ (入力順)")
+
+
+class JobUsage(BaseModel):
+    user_cpu: float = Field(..., description="ユーザー CPU 時間 (秒)")
+    system_cpu: float = Field(..., description="システム CPU 時間 (秒)")
+    max_rss_kb: int = Field(..., description="最大常駐メモリ (KiB)")
+    wall_time: float = Field(..., description="経過時間 (秒)")
+    exit_code: int | None = Field(None, description="終了コード")
+    signal: int | None = Field(None, description="終了させたシグナル")
+
+
+class JobResultResponse(BaseModel):
+    job_id: UUID = Field(..., description="ジョブ ID")
+    state: JobStateName = Field(..., description="ジョブの状態")
+    output: str = Field("", description="Codex の応答")
+    error: str | None = Field(None, description="失敗時のエラーメッセージ")
+    usage: JobUsage | None = Field(None, description="Codex の資源使用量 (取得できた場合)")
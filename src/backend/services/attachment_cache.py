@@ -0,0 +1,243 @@
+"""Discord 添付ファイルを内容ハッシュで保存するローカルキャッシュ。
+
+添付はプロンプトへ埋め込まず、キャッシュ上のパスを Codex に渡して読ませる。
+保存先は `blobs/{digest[:2]}/{digest}{拡張子}`。添付 ID から内容ハッシュへの対応を
+`refs/` に残すため、同じ添付を何度参照してもダウンロードは 1 回で済む。
+取得したファイルは `release()` するまで削除対象から外れる (実行中のプロンプトが参照するため)。
+
+discord.py に依存しないため、ダウンロード処理は呼び出し側から渡す。
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import os
+import re
+from collections import Counter
+from collections.abc import Awaitable, Callable, Collection, Sequence
+from dataclasses import dataclass, field
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+SUFFIX_PATTERN = re.compile(r"\.[A-Za-z0-9]{1,15}")
+SOURCE_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]+")
+
+
+class AttachmentTooLargeError(ValueError):
+    """添付がサイズ上限を超えている場合のエラー。"""
+
+    def __init__(self, size: int, limit: int):
+        super().__init__(f"{size} bytes exceeds the {limit} byte limit")
+        self.size = size
+        self.limit = limit
+
+
+@dataclass(slots=True, frozen=True)
+class AttachmentSource:
+    """ダウンロード前の添付。size は送信元が申告したバイト数。"""
+
+    source_id: str
+    filename: str
+    size: int
+    download: Callable[[], Awaitable[bytes]] = field(repr=False, compare=False)
+
+
+@dataclass(slots=True, frozen=True)
+class CachedAttachment:
+    filename: str
+    path: Path
+    size: int
+    digest: str
+
+
+@dataclass(slots=True)
+class AttachmentBatch:
+    files: list[CachedAttachment] = field(default_factory=list)
+    # (ファイル名, 取り込めなかった理由)
+    skipped: list[tuple[str, str]] = field(default_factory=list)
+
+
+class AttachmentCache:
+    """サイズ上限付きで添付を並行ダウンロードし、内容ハッシュで重複排除して保存する。"""
+
+    def __init__(
+        self,
+        base_dir: Path,
+        *,
+        max_file_bytes: int,
+        max_total_bytes: int,
+        concurrency: int = 4,
+    ) -> None:
+        self._base_dir = base_dir
+        self._max_file_bytes = max_file_bytes
+        self._max_total_bytes = max_total_bytes
+        self._semaphore = asyncio.Semaphore(max(1, concurrency))
+        # 同じ添付の同時取得を 1 回のダウンロードにまとめる
+        self._inflight: dict[str, asyncio.Future[CachedAttachment]] = {}
+        # 実行中のプロンプトが参照しているファイル (release() で外す)
+        self._pinned: Counter[Path] = Counter()
+        self._needs_prune = False
+
+    async def fetch_many(self, sources: Sequence[AttachmentSource]) -> AttachmentBatch:
+        """添付をまとめて取得する。失敗した添付は理由とともに skipped に入れる。
+
+        返したファイルは使い終わったら release() すること。
+        """
+        results = await asyncio.gather(
+            *(self.fetch(source) for source in sources), return_exceptions=True
+        )
+        batch = AttachmentBatch()
+        for source, result in zip(sources, results):
+            if isinstance(result, CachedAttachment):
+                self._pinned[result.path] += 1
+                batch.files.append(result)
+            elif isinstance(result, AttachmentTooLargeError):
+                batch.skipped.append((source.filename, f"too large ({result})"))
+            elif isinstance(result, Exception):
+                logger.warning("failed to fetch attachment %s", source.filename, exc_info=result)
+                batch.skipped.append((source.filename, "download failed"))
+            else:
+                raise result
+        if self._needs_prune:
+            self._needs_prune = False
+            # 取得中の他のバッチや実行中のプロンプトが参照するファイルは残す
+            await asyncio.to_thread(self.prune, frozenset(self._pinned))
+        return batch
+
+    def release(self, batch: AttachmentBatch) -> None:
+        """fetch_many() が返したファイルを削除対象へ戻す。"""
+        for cached in batch.files:
+            self._pinned[cached.path] -= 1
+            if self._pinned[cached.path] <= 0:
+                del self._pinned[cached.path]
+
+    async def fetch(self, source: AttachmentSource) -> CachedAttachment:
+        """キャッシュにあればそれを返し、なければダウンロードして保存する。"""
+        if source.size > self._max_file_bytes:
+            raise AttachmentTooLargeError(source.size, self._max_file_bytes)
+
+        cached = await asyncio.to_thread(self._lookup, source)
+        if cached is not None:
+            return cached
+
+        pending = self._inflight.get(source.source_id)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future: asyncio.Future[CachedAttachment] = asyncio.get_running_loop().create_future()
+        self._inflight[source.source_id] = future
+        try:
+            async with self._semaphore:
+                data = await source.download()
+            if len(data) > self._max_file_bytes:
+                raise AttachmentTooLargeError(len(data), self._max_file_bytes)
+            cached = await asyncio.to_thread(self._store, source, data)
+            future.set_result(cached)
+            return cached
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as exc:
+            future.set_exception(exc)
+            # 待機者がいない場合に "exception was never retrieved" を出さない
+            future.exception()
+            raise
+        finally:
+            del self._inflight[source.source_id]
+
+    def prune(self, keep: Collection[Path] = ()) -> int:
+        """合計サイズが上限を超えていれば、最近使われていない内容から削除する (keep は残す)。
+
+        削除した内容を指す refs/ も合わせて消す。
+        """
+        blobs = []
+        total = 0
+        for path in self._base_dir.glob("blobs/*/*"):
+            if path.name.endswith(".tmp"):
+                # 書き込み中のファイルは対象外
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            blobs.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+        removed = 0
+        for _, size, path in sorted(blobs):
+            if total <= self._max_total_bytes:
+                break
+            if path in keep:
+                continue
+            path.unlink(missing_ok=True)
+            total -= size
+            removed += 1
+        if removed:
+            self._prune_refs()
+        return removed
+
+    def _prune_refs(self) -> None:
+        """内容が削除済みの refs/ を消す。"""
+        for ref in self._base_dir.glob("refs/*"):
+            try:
+                name = ref.read_text(encoding="utf-8").strip()
+            except FileNotFoundError:
+                continue
+            if not (self._base_dir / "blobs" / name).exists():
+                ref.unlink(missing_ok=True)
+
+    def _lookup(self, source: AttachmentSource) -> CachedAttachment | None:
+        ref = self._ref_path(source.source_id)
+        if ref is None:
+            return None
+        try:
+            name = ref.read_text(encoding="utf-8").strip()
+        except FileNotFoundError:
+            return None
+        path = self._base_dir / "blobs" / name
+        try:
+            size = path.stat().st_size
+            # prune() が参照順で削除できるよう、利用時刻を更新する
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return CachedAttachment(
+            filename=source.filename, path=path, size=size, digest=path.name.split(".", 1)[0]
+        )
+
+    def _store(self, source: AttachmentSource, data: bytes) -> CachedAttachment:
+        digest = hashlib.sha256(data).hexdigest()
+        match = SUFFIX_PATTERN.fullmatch(Path(source.filename).suffix)
+        name = f"{digest[:2]}/{digest}{match.group(0).lower() if match else ''}"
+        path = self._base_dir / "blobs" / name
+        if path.exists():
+            os.utime(path)
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_name(path.name + ".tmp")
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, path)
+            # 削除はバッチの取得が揃ってから fetch_many() でまとめて行う
+            self._needs_prune = True
+
+        ref = self._ref_path(source.source_id)
+        if ref is not None:
+            ref.parent.mkdir(parents=True, exist_ok=True)
+            ref.write_text(name, encoding="utf-8")
+        return CachedAttachment(filename=source.filename, path=path, size=len(data), digest=digest)
+
+    def _ref_path(self, source_id: str) -> Path | None:
+        if not SOURCE_ID_PATTERN.fullmatch(source_id):
+            return None
+        return self._base_dir / "refs" / source_id
+
+
+__all__ = [
+    "AttachmentBatch",
+    "AttachmentCache",
+    "AttachmentSource",
+    "AttachmentTooLargeError",
+    "CachedAttachment",
+]
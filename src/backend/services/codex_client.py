@@ -3,10 +3,22 @@ from __future__ import annotations
 
 import asyncio
 import json
+import math
+import os
+import signal
+import sys
+import time
+from collections import deque
 from contextlib import suppress
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 from pathlib import Path
 from typing import List
+from uuid import uuid4
+
+READ_CHUNK_SIZE = 65536
+ADAPTIVE_TIMEOUT_PERCENTILE = 0.95
+ADAPTIVE_TIMEOUT_MULTIPLIER = 2.0
+LAUNCH_FAILURE_EXIT_CODE = 127
 
 
 @dataclass(slots=True)
@@ -16,28 +28,168 @@ class CodexConfig:
     timeout: float = 120.0
     color: str = "never"
     json_output: bool = True
+    # 出力が idle_timeout 秒途絶えたらハングとみなして停止する (None で無効)
+    idle_timeout: float | None = None
+    # SIGTERM 後、SIGKILL へ切り替えるまでの猶予 (秒)
+    kill_grace: float = 5.0
+    # 過去の実行時間から workdir ごとのタイムアウトを決める
+    adaptive_timeout: bool = False
+    min_timeout: float = 30.0
+    max_timeout: float = 600.0
+    # 実行ごとの資源使用量 (wait4 の rusage) を取得する
+    track_resources: bool = True
+    # 資源制限 (None で無制限)。memory_limit は cgroup があれば memory.max、
+    # なければ RLIMIT_DATA で掛ける。process_limit は cgroup の pids.max でのみ掛ける
+    # (cgroup_parent がなければ効かない。Settings が読み込み時に拒否する)
+    # (RLIMIT_NPROC は実行ユーザー全体のプロセス・スレッド数を数えるため使わない)
+    cpu_time_limit: int | None = None
+    memory_limit: int | None = None
+    process_limit: int | None = None
+    # 指定すると配下に実行ごとの cgroup v2 を作り memory.max / pids.max を設定する
+    cgroup_parent: Path | None = None
+
+
+@dataclass(slots=True, frozen=True)
+class ResourceUsage:
+    """1 回の Codex 実行で消費した資源。"""
+
+    user_cpu: float
+    system_cpu: float
+    max_rss_kb: int
+    wall_time: float
+    exit_code: int | None = None
+    signal: int | None = None
+
+    @property
+    def cpu_time(self) -> float:
+        return self.user_cpu + self.system_cpu
+
+    def as_dict(self) -> dict[str, float | int | None]:
+        return {
+            "user_cpu": round(self.user_cpu, 3),
+            "system_cpu": round(self.system_cpu, 3),
+            "max_rss_kb": self.max_rss_kb,
+            "wall_time": round(self.wall_time, 3),
+            "exit_code": self.exit_code,
+            "signal": self.signal,
+        }
+
+
+@dataclass(slots=True)
+class ResourceUsageTotals:
+    """クライアント単位の累積資源使用量。"""
+
+    runs: int = 0
+    user_cpu: float = 0.0
+    system_cpu: float = 0.0
+    wall_time: float = 0.0
+    peak_rss_kb: int = 0
+
+    def add(self, usage: ResourceUsage) -> None:
+        self.runs += 1
+        self.user_cpu += usage.user_cpu
+        self.system_cpu += usage.system_cpu
+        self.wall_time += usage.wall_time
+        self.peak_rss_kb = max(self.peak_rss_kb, usage.max_rss_kb)
+
+
+@dataclass(slots=True, frozen=True)
+class CodexRunResult:
+    text: str
+    usage: ResourceUsage | None = None
 
 
 class CodexExecutionError(RuntimeError):
     """Codex 実行時のエラー。"""
 
+    # 失敗した実行でも取得できた資源使用量 (プロセス起動前の失敗などでは None)
+    usage: ResourceUsage | None = None
+
 
 class CodexTimeoutError(CodexExecutionError):
     """Codex 実行がタイムアウトした場合のエラー。"""
 
-    def __init__(self, timeout: float):
-        super().__init__(f"codex exec timed out after {timeout:.1f}s")
+    def __init__(self, timeout: float, message: str | None = None):
+        super().__init__(message or f"codex exec timed out after {timeout:.1f}s")
         self.timeout = timeout
 
 
+class CodexHangError(CodexTimeoutError):
+    """Codex が一定時間何も出力せずハングした場合のエラー。"""
+
+    def __init__(self, idle_timeout: float):
+        super().__init__(
+            idle_timeout, f"codex exec produced no output for {idle_timeout:.1f}s"
+        )
+
+
+class CodexResourceLimitError(CodexExecutionError):
+    """Codex 実行が資源制限を超えて停止させられた場合のエラー。"""
+
+
+class RunDurationHistory:
+    """workdir ごとの直近の実行時間を保持し、パーセンタイルを求める。"""
+
+    def __init__(self, window: int = 50, min_samples: int = 5):
+        self._window = window
+        self._min_samples = min_samples
+        # (実行時間, タイムアウトで打ち切ったか)
+        self._durations: dict[str, deque[tuple[float, bool]]] = {}
+
+    def record(self, key: str, seconds: float, *, timed_out: bool = False) -> None:
+        """打ち切った実行は実際にはもっと長くかかるため、timed_out=True で記録する。"""
+        samples = self._durations.setdefault(key, deque(maxlen=self._window))
+        samples.append((seconds, timed_out))
+
+    def percentile(self, key: str, q: float) -> float | None:
+        """サンプル数が min_samples 未満なら None を返す。"""
+        samples = self._durations.get(key)
+        if not samples or len(samples) < self._min_samples:
+            return None
+        ordered = sorted(seconds for seconds, _ in samples)
+        index = min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))
+        return ordered[index]
+
+    def longest_timed_out(self, key: str) -> float | None:
+        """直近の window 内で打ち切った実行のうち最長の実行時間。"""
+        timed_out = [seconds for seconds, flag in self._durations.get(key, ()) if flag]
+        return max(timed_out) if timed_out else None
+
+
 class CodexClient:
     """Codex CLI を `codex exec` 経由で呼び出すクライアント。"""
 
-    def __init__(self, config: CodexConfig):
+    def __init__(self, config: CodexConfig, history: RunDurationHistory | None = None):
         self._config = config
+        self._history = history or RunDurationHistory()
+        self._usage_totals = ResourceUsageTotals()
+
+    def usage_totals(self) -> ResourceUsageTotals:
+        """これまでの実行の累積資源使用量を返す。"""
+        return replace(self._usage_totals)
+
+    def effective_timeout(self) -> float:
+        """今回の実行に適用するタイムアウト (秒) を返す。"""
+        if not self._config.adaptive_timeout:
+            return self._config.timeout
+        key = str(self._config.workdir)
+        observed = self._history.percentile(key, ADAPTIVE_TIMEOUT_PERCENTILE)
+        if observed is None:
+            return self._config.timeout
+        # 打ち切った実行があれば、少なくともその時間の倍までは待つ
+        observed = max(observed, self._history.longest_timed_out(key) or 0.0)
+        return min(
+            self._config.max_timeout,
+            max(self._config.min_timeout, observed * ADAPTIVE_TIMEOUT_MULTIPLIER),
+        )
 
     async def run(self, prompt: str) -> str:
         """Codex CLI を一度呼び出し、最終のアシスタント応答文字列を返す。"""
+        result = await self.run_with_usage(prompt)
+        return result.text
+
+    async def run_with_usage(self, prompt: str) -> CodexRunResult:
+        """`run` と同じく Codex を呼び出し、応答と資源使用量を返す。"""
         cmd: List[str] = [
             self._config.command,
             "exec",
@@ -48,34 +200,72 @@ class CodexClient:
         if self._config.json_output:
             cmd.append("--json")
 
-        process = await asyncio.create_subprocess_exec(
-            *cmd,
-            stdin=asyncio.subprocess.PIPE,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
-        )
+        report_fd: int | None = None
+        report: _LauncherReport | None = None
+        pass_fds: tuple[int, ...] = ()
+        cgroup = self._create_cgroup()
+        try:
+            if self._uses_launcher():
+                report_fd, report_write_fd = os.pipe()
+                report = _LauncherReport(report_fd)
+                pass_fds = (report_write_fd,)
+                cmd = self._launcher_command(report_write_fd, cgroup) + cmd
+
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    *cmd,
+                    stdin=asyncio.subprocess.PIPE,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE,
+                    # 子孫プロセスもまとめて停止できるようプロセスグループを分ける
+                    start_new_session=True,
+                    pass_fds=pass_fds,
+                )
+            finally:
+                for fd in pass_fds:
+                    os.close(fd)
 
-        assert process.stdin is not None
-        stdin_payload = prompt.rstrip("\n") + "\n"
-        process.stdin.write(stdin_payload.encode("utf-8"))
-        await process.stdin.drain()
-        process.stdin.close()
+            assert process.stdin is not None
+            stdin_payload = prompt.rstrip("\n") + "\n"
+            # プロンプトを読まずに終了した場合も、出力と終了コードから結果を判断する
+            with suppress(BrokenPipeError, ConnectionResetError):
+                process.stdin.write(stdin_payload.encode("utf-8"))
+                await process.stdin.drain()
+            process.stdin.close()
 
+            timeout = self.effective_timeout()
+            started = time.monotonic()
+            try:
+                stdout_bytes, stderr_bytes = await self._collect_output(process, timeout)
+            except BaseException as exc:
+                await self._terminate(process, report)
+                elapsed = time.monotonic() - started
+                usage = self._read_usage(report, elapsed)
+                if isinstance(exc, CodexTimeoutError) and not isinstance(exc, CodexHangError):
+                    # 打ち切った実行も少なくとも timeout 秒かかるものとして履歴に残し、
+                    # 適応タイムアウトが長い実行を締め出し続けないようにする
+                    self._history.record(str(self._config.workdir), elapsed, timed_out=True)
+                if isinstance(exc, CodexExecutionError):
+                    exc.usage = usage
+                raise
+            elapsed = time.monotonic() - started
+            usage = self._read_usage(report, elapsed)
+        finally:
+            if report_fd is not None:
+                os.close(report_fd)
+            if cgroup is not None:
+                with suppress(OSError):
+                    cgroup.rmdir()
+        self._history.record(str(self._config.workdir), elapsed)
         try:
-            stdout_bytes, stderr_bytes = await asyncio.wait_for(
-                process.communicate(), timeout=self._config.timeout
-            )
-        except asyncio.TimeoutError as exc:
-            process.kill()
-            with suppress(ProcessLookupError):
-                await process.wait()
-            raise CodexTimeoutError(self._config.timeout) from exc
-        except asyncio.CancelledError:
-            process.kill()
-            with suppress(ProcessLookupError):
-                await process.wait()
+            self._check_usage(usage, stdout_bytes, stderr_bytes)
+            text = self._format_response(stdout_bytes, stderr_bytes)
+        except CodexExecutionError as exc:
+            exc.usage = usage
             raise
+        return CodexRunResult(text=text, usage=usage)
 
+    def _format_response(self, stdout_bytes: bytes, stderr_bytes: bytes) -> str:
         stdout_text = stdout_bytes.decode("utf-8", errors="ignore")
         stderr_text = stderr_bytes.decode("utf-8", errors="ignore")
 
@@ -100,6 +290,136 @@ class CodexClient:
 
         return response_text
 
+    def _uses_launcher(self) -> bool:
+        config = self._config
+        return (
+            config.track_resources
+            or config.cpu_time_limit is not None
+            or config.memory_limit is not None
+            or config.process_limit is not None
+            or config.cgroup_parent is not None
+        )
+
+    def _launcher_command(self, report_fd: int, cgroup: Path | None) -> list[str]:
+        config = self._config
+        cmd = [sys.executable, "-m", f"{__package__}.codex_launcher", "--report-fd", str(report_fd)]
+        if config.cpu_time_limit is not None:
+            cmd += ["--cpu-time", str(config.cpu_time_limit)]
+        if config.memory_limit is not None and cgroup is None:
+            # cgroup があれば memory.max が実使用量で制限する
+            cmd += ["--memory", str(config.memory_limit)]
+        if cgroup is not None:
+            cmd += ["--cgroup", str(cgroup)]
+        return cmd + ["--"]
+
+    def _create_cgroup(self) -> Path | None:
+        """実行ごとの cgroup v2 を作成する。作成できなければ None。"""
+        parent = self._config.cgroup_parent
+        if parent is None:
+            return None
+        cgroup = parent / f"codex-{uuid4().hex}"
+        try:
+            cgroup.mkdir()
+            if self._config.memory_limit is not None:
+                (cgroup / "memory.max").write_text(str(self._config.memory_limit))
+            if self._config.process_limit is not None:
+                (cgroup / "pids.max").write_text(str(self._config.process_limit))
+        except OSError as exc:
+            with suppress(OSError):
+                cgroup.rmdir()
+            raise CodexExecutionError(f"failed to prepare cgroup {cgroup}: {exc}") from exc
+        return cgroup
+
+    def _read_usage(
+        self, launcher_report: _LauncherReport | None, wall_time: float
+    ) -> ResourceUsage | None:
+        """ランチャーの報告を読み取り、累積値へ加算する。"""
+        if launcher_report is None:
+            return None
+        report = launcher_report.usage()
+        if report is None:
+            return None
+        usage = ResourceUsage(
+            user_cpu=float(report.get("user_cpu", 0.0)),
+            system_cpu=float(report.get("system_cpu", 0.0)),
+            max_rss_kb=int(report.get("max_rss_kb", 0)),
+            wall_time=wall_time,
+            exit_code=report.get("exit_code"),
+            signal=report.get("signal"),
+        )
+        self._usage_totals.add(usage)
+        return usage
+
+    def _check_usage(
+        self, usage: ResourceUsage | None, stdout_bytes: bytes, stderr_bytes: bytes
+    ) -> None:
+        if usage is None:
+            return
+        if usage.exit_code == LAUNCH_FAILURE_EXIT_CODE and not stdout_bytes:
+            detail = stderr_bytes.decode("utf-8", errors="ignore").strip()
+            raise CodexExecutionError(detail or "failed to launch codex")
+        limit = self._config.cpu_time_limit
+        if limit is None:
+            return
+        xcpu = usage.signal == signal.SIGXCPU or usage.exit_code == 128 + signal.SIGXCPU
+        killed = usage.signal == signal.SIGKILL and usage.user_cpu + usage.system_cpu >= limit
+        if xcpu or killed:
+            raise CodexResourceLimitError(f"codex exec exceeded CPU time limit ({limit}s)")
+
+    async def _collect_output(
+        self, process: asyncio.subprocess.Process, timeout: float
+    ) -> tuple[bytes, bytes]:
+        """stdout を逐次読み取り、全体タイムアウトと無出力タイムアウトを監視する。"""
+        assert process.stdout is not None and process.stderr is not None
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        idle_timeout = self._config.idle_timeout
+        stderr_task = asyncio.create_task(process.stderr.read())
+        chunks: list[bytes] = []
+        try:
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise CodexTimeoutError(timeout)
+                wait = remaining if idle_timeout is None else min(remaining, idle_timeout)
+                try:
+                    chunk = await asyncio.wait_for(process.stdout.read(READ_CHUNK_SIZE), wait)
+                except asyncio.TimeoutError:
+                    if idle_timeout is not None and wait == idle_timeout:
+                        raise CodexHangError(idle_timeout) from None
+                    raise CodexTimeoutError(timeout) from None
+                if not chunk:
+                    break
+                chunks.append(chunk)
+            remaining = max(0.0, deadline - loop.time())
+            try:
+                stderr_bytes = await asyncio.wait_for(asyncio.shield(stderr_task), remaining)
+                await asyncio.wait_for(process.wait(), max(0.0, deadline - loop.time()))
+            except asyncio.TimeoutError:
+                raise CodexTimeoutError(timeout) from None
+        finally:
+            if not stderr_task.done():
+                stderr_task.cancel()
+        return b"".join(chunks), stderr_bytes
+
+    async def _terminate(
+        self, process: asyncio.subprocess.Process, report: _LauncherReport | None
+    ) -> None:
+        """SIGTERM で終了を促し、猶予内に終わらなければ SIGKILL する。
+
+        ランチャー経由なら Codex のプロセスグループだけへ送り、ランチャーは残して
+        rusage を報告させる。
+        """
+        _signal_process_group(_codex_pgid(process, report), signal.SIGTERM)
+        try:
+            await asyncio.wait_for(process.wait(), timeout=self._config.kill_grace)
+            return
+        except asyncio.TimeoutError:
+            pass
+        _signal_process_group(_codex_pgid(process, report), signal.SIGKILL)
+        with suppress(ProcessLookupError):
+            await process.wait()
+
     def _extract_messages(self, stdout_text: str) -> list[str]:
         messages: list[str] = []
         for line in stdout_text.splitlines():
@@ -140,9 +460,63 @@ class CodexClient:
         return messages
 
 
+class _LauncherReport:
+    """ランチャーが report fd へ 1 行ずつ書く JSON (pgid と rusage) を読み取る。"""
+
+    def __init__(self, fd: int):
+        self._fd = fd
+        self._buffer = b""
+        os.set_blocking(fd, False)
+
+    def _records(self) -> list[dict]:
+        with suppress(BlockingIOError):
+            while chunk := os.read(self._fd, 4096):
+                self._buffer += chunk
+        records: list[dict] = []
+        # 書きかけの最終行は次回の呼び出しで読み直す
+        for line in self._buffer.split(b"\n"):
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(record, dict):
+                records.append(record)
+        return records
+
+    def pgid(self) -> int | None:
+        for record in self._records():
+            if "pgid" in record:
+                return int(record["pgid"])
+        return None
+
+    def usage(self) -> dict | None:
+        for record in self._records():
+            if "user_cpu" in record:
+                return record
+        return None
+
+
+def _codex_pgid(process: asyncio.subprocess.Process, report: _LauncherReport | None) -> int:
+    # ランチャーが fork 前ならグループは未確定。その場合はランチャー自身のグループへ送る
+    pgid = report.pgid() if report is not None else None
+    return process.pid if pgid is None else pgid
+
+
+def _signal_process_group(pgid: int, sig: signal.Signals) -> None:
+    # Codex が起動したビルド等の子孫プロセスも含めてシグナルを送る
+    with suppress(ProcessLookupError, PermissionError):
+        os.killpg(pgid, sig)
+
+
 __all__ = [
     "CodexClient",
     "CodexConfig",
     "CodexExecutionError",
+    "CodexHangError",
+    "CodexResourceLimitError",
+    "CodexRunResult",
     "CodexTimeoutError",
+    "ResourceUsage",
+    "ResourceUsageTotals",
+    "RunDurationHistory",
 ]
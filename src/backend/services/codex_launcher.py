@@ -0,0 +1,93 @@
+"""資源制限を掛けて Codex CLI を起動し、wait4 の rusage を報告するランチャー。
+
+`python -m backend.services.codex_launcher --report-fd N [制限] -- codex exec ...`
+の形で CodexClient から起動される。asyncio は子プロセスを自前で回収するため、
+rusage を取るには間に 1 段プロセスを挟んで wait4 する必要がある。
+report fd には JSON を 1 行ずつ書く: fork 直後に Codex のプロセスグループ
+(`{"pgid": N}`)、終了後に rusage。クライアントは停止シグナルをこのグループへ送る。
+標準ライブラリ以外を import しないこと (起動時間を抑えるため)。
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import resource
+import signal
+import sys
+
+
+def _parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="codex_launcher")
+    parser.add_argument("--report-fd", type=int, required=True)
+    parser.add_argument("--cpu-time", type=int, default=None)
+    parser.add_argument("--memory", type=int, default=None)
+    parser.add_argument("--cgroup", default=None)
+    parser.add_argument("command", nargs=argparse.REMAINDER)
+    args = parser.parse_args(argv)
+    if args.command and args.command[0] == "--":
+        args.command = args.command[1:]
+    if not args.command:
+        parser.error("command is required")
+    return args
+
+
+def _apply_limits(args: argparse.Namespace) -> None:
+    if args.cpu_time is not None:
+        # ソフト上限で SIGXCPU、猶予 5 秒後にハード上限で SIGKILL
+        resource.setrlimit(resource.RLIMIT_CPU, (args.cpu_time, args.cpu_time + 5))
+    if args.memory is not None:
+        # RLIMIT_AS は予約しただけのアドレス空間も数え、Node などが起動できなくなる。
+        # 書き込み可能な private 領域 (ヒープ・匿名 mmap) だけを数える RLIMIT_DATA を使う
+        resource.setrlimit(resource.RLIMIT_DATA, (args.memory, args.memory))
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = _parse_args(sys.argv[1:] if argv is None else argv)
+
+    if args.cgroup:
+        # 自身を cgroup へ移してから fork し、子孫すべてを同じ cgroup に入れる
+        with open(os.path.join(args.cgroup, "cgroup.procs"), "w") as file:
+            file.write(str(os.getpid()))
+
+    # 停止はクライアントが Codex のプロセスグループへ送る。fork 前から無視しておき、
+    # SIGKILL へのエスカレーションでもランチャー自身は生き残って rusage を報告する
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    pid = os.fork()
+    if pid == 0:
+        os.close(args.report_fd)
+        try:
+            os.setpgid(0, 0)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            _apply_limits(args)
+            os.execvp(args.command[0], args.command)
+        except OSError as exc:
+            print(f"codex_launcher: {exc}", file=sys.stderr)
+        os._exit(127)
+
+    # 子と親の両方で setpgid し、どちらが先に走っても報告前にグループが確定するようにする
+    try:
+        os.setpgid(pid, pid)
+    except OSError:
+        pass  # 子が先に setpgid 済み、または exec 済み
+    os.write(args.report_fd, (json.dumps({"pgid": pid}) + "\n").encode("utf-8"))
+
+    _, status, usage = os.wait4(pid, 0)
+    report = {
+        "user_cpu": usage.ru_utime,
+        "system_cpu": usage.ru_stime,
+        "max_rss_kb": usage.ru_maxrss,
+        "exit_code": os.WEXITSTATUS(status) if os.WIFEXITED(status) else None,
+        "signal": os.WTERMSIG(status) if os.WIFSIGNALED(status) else None,
+    }
+    with os.fdopen(args.report_fd, "w") as file:
+        file.write(json.dumps(report) + "\n")
+    exit_code = os.waitstatus_to_exitcode(status)
+    return exit_code if exit_code >= 0 else 128 - exit_code
+
+
+if __name__ == "__main__":  # pragma: no cover - subprocess entry point
+    sys.exit(main())
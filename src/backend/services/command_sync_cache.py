@@ -0,0 +1,52 @@
+"""Discord Slash Command の同期済みハッシュを保存するキャッシュ。"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_SCOPE = "global"
+
+
+class CommandSyncCache:
+    """アプリケーション・ギルド単位で最後に同期したコマンドツリーのハッシュを保持する。"""
+
+    def __init__(self, path: Path) -> None:
+        self._path = path
+        self._hashes: dict[str, str] | None = None
+
+    def get(self, application_id: int, scope: str) -> str | None:
+        return self._load().get(self._key(application_id, scope))
+
+    def set(self, application_id: int, scope: str, digest: str) -> None:
+        self._load()[self._key(application_id, scope)] = digest
+
+    def save(self) -> None:
+        """一時ファイル経由で原子的に書き出す。"""
+        hashes = self._load()
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self._path.with_suffix(self._path.suffix + ".tmp")
+        tmp_path.write_text(json.dumps(hashes, indent=2, sort_keys=True), encoding="utf-8")
+        os.replace(tmp_path, self._path)
+
+    def _load(self) -> dict[str, str]:
+        if self._hashes is None:
+            try:
+                data = json.loads(self._path.read_text(encoding="utf-8"))
+            except FileNotFoundError:
+                data = {}
+            except (OSError, json.JSONDecodeError):
+                logger.warning("ignoring unreadable command sync cache %s", self._path, exc_info=True)
+                data = {}
+            self._hashes = {str(k): str(v) for k, v in data.items()} if isinstance(data, dict) else {}
+        return self._hashes
+
+    @staticmethod
+    def _key(application_id: int, scope: str) -> str:
+        return f"{application_id}:{scope}"
+
+
+__all__ = ["CommandSyncCache", "GLOBAL_SCOPE"]
@@ -0,0 +1,37 @@
+"""負荷試験用に `codex exec --json` の出力を模倣するスタブ。
+
+`python -m backend.services.fake_codex exec ...` として起動すると標準入力のプロンプトを読み、
+`--delay` 秒 (プロンプト 1000 文字ごとに `--delay-per-kchar` 秒を加算) 待ってから
+agent_message を 1 行出力する。CodexClient の引数 (`exec`, `--cd` など) は無視する。
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import time
+
+DELAY_ENV = "CODEX_FAKE_DELAY"
+DELAY_PER_KCHAR_ENV = "CODEX_FAKE_DELAY_PER_KCHAR"
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="fake_codex")
+    parser.add_argument("--delay", type=float, default=float(os.environ.get(DELAY_ENV, "0.5")))
+    parser.add_argument(
+        "--delay-per-kchar",
+        type=float,
+        default=float(os.environ.get(DELAY_PER_KCHAR_ENV, "0")),
+    )
+    args, _ = parser.parse_known_args(sys.argv[1:] if argv is None else argv)
+
+    prompt = sys.stdin.read()
+    time.sleep(args.delay + args.delay_per_kchar * len(prompt) / 1000)
+    message = {"msg": {"type": "agent_message", "message": f"fake response ({len(prompt)} chars)"}}
+    sys.stdout.write(json.dumps(message) + "\n")
+    return 0
+
+
+if __name__ == "__main__":  # pragma: no cover - subprocess entry point
+    sys.exit(main())
@@ -0,0 +1,118 @@
+"""ジョブ API (`/jobs`) 経由で Codex を実行するクライアント。
+
+複数の Discord シャードプロセスが 1 台の API サーバーのワーカープールを共有し、
+同時実行数と未処理ジョブ数の上限 (job_worker_count / job_max_pending) を揃えるために使う。
+CodexClient と同じ `run` / `run_with_usage` を提供する。
+
+API 側のクォータはこのクライアントの API キー (未指定なら接続元アドレス) に対して数えられる。
+Discord ユーザー・チャンネル単位のクォータは、結果に含まれる資源使用量を使ってボット側で計上する。
+"""
+from __future__ import annotations
+
+from contextlib import suppress
+
+import aiohttp
+
+from .codex_client import CodexExecutionError, CodexRunResult, ResourceUsage
+
+LONG_POLL_SECONDS = 30.0
+API_KEY_HEADER = "X-API-Key"
+
+
+class JobApiCodexClient:
+    """Codex の実行をジョブ API へ委譲するクライアント。"""
+
+    def __init__(
+        self,
+        base_url: str,
+        *,
+        api_key: str | None = None,
+        long_poll: float = LONG_POLL_SECONDS,
+    ) -> None:
+        self._base_url = base_url.rstrip("/")
+        self._api_key = api_key
+        self._long_poll = long_poll
+        self._session: aiohttp.ClientSession | None = None
+
+    async def run(self, prompt: str) -> str:
+        result = await self.run_with_usage(prompt)
+        return result.text
+
+    async def run_with_usage(self, prompt: str) -> CodexRunResult:
+        """ジョブを投入し、完了まで long-poll して結果と資源使用量を返す。"""
+        session = self._get_session()
+        try:
+            async with session.post(f"{self._base_url}/jobs", json={"text": prompt}) as response:
+                if response.status == 429:
+                    # キュー満杯またはクォータ超過
+                    detail = None
+                    with suppress(ValueError, KeyError, TypeError):
+                        detail = (await response.json(content_type=None))["detail"]
+                    retry_after = response.headers.get("Retry-After")
+                    message = f"codex job rejected: {detail or 'too many requests'}"
+                    if retry_after:
+                        message += f" (retry after {retry_after}s)"
+                    raise CodexExecutionError(message)
+                response.raise_for_status()
+                etag = response.headers.get("ETag")
+                job = await response.json()
+            job_id = job["job_id"]
+            state = job["state"]
+
+            while state not in ("succeeded", "failed"):
+                headers = {"If-None-Match": etag} if etag else {}
+                async with session.get(
+                    f"{self._base_url}/jobs/{job_id}",
+                    params={"wait": str(self._long_poll)},
+                    headers=headers,
+                ) as response:
+                    if response.status == 304:
+                        continue
+                    response.raise_for_status()
+                    etag = response.headers.get("ETag")
+                    state = (await response.json())["state"]
+
+            async with session.get(f"{self._base_url}/jobs/{job_id}/result") as response:
+                response.raise_for_status()
+                result = await response.json()
+        except aiohttp.ClientError as exc:
+            raise CodexExecutionError(f"job API request failed: {exc}") from exc
+
+        usage = _parse_usage(result.get("usage"))
+        if result["state"] == "failed":
+            error = CodexExecutionError(result.get("error") or "codex job failed")
+            error.usage = usage
+            raise error
+        return CodexRunResult(text=result.get("output", ""), usage=usage)
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            timeout = aiohttp.ClientTimeout(total=None, sock_read=self._long_poll + 30)
+            headers = {API_KEY_HEADER: self._api_key} if self._api_key else None
+            self._session = aiohttp.ClientSession(timeout=timeout, headers=headers)
+        return self._session
+
+
+def _parse_usage(data: object) -> ResourceUsage | None:
+    """結果の usage を ResourceUsage に戻す。古い API サーバーなどで欠けていれば None。"""
+    if not isinstance(data, dict):
+        return None
+    try:
+        return ResourceUsage(
+            user_cpu=float(data["user_cpu"]),
+            system_cpu=float(data["system_cpu"]),
+            max_rss_kb=int(data["max_rss_kb"]),
+            wall_time=float(data["wall_time"]),
+            exit_code=data.get("exit_code"),
+            signal=data.get("signal"),
+        )
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+__all__ = ["JobApiCodexClient"]
@@ -0,0 +1,272 @@
+"""セッションログの `input` イベントを再生して本番相当の負荷を再現するツール。
+
+    python -m backend.services.log_replay --since 2025-10-01 --speed 10 --target client
+
+- `--target client`: CodexClient を直接呼び出す。既定ではスタブ (`fake_codex`) を使う。
+  `--concurrency` で Discord ボットと同じセマフォ上限を模倣し、待ち時間も計測する。
+- `--target api`: セッション API (`--base-url`) を HTTP で呼び出す。
+  ログ上のセッションごとに新しいセッションを作成し、同じ順序で 1 件ずつ入力を送る
+  (API は応答キューから先に取り出した出力を返すため、同時に送ると対応が崩れる)。
+  同時リクエスト数は `--concurrency` で制限し、その待ち時間をキュー待ちとして計測する。
+  作成したセッションは再生後に削除する。クォータが有効な場合は `--api-key` を渡す。
+
+元の到着間隔を `--speed` 倍に圧縮して投入する (0 で間隔を無視して一斉投入)。
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import stat
+import statistics
+import sys
+import tempfile
+import time
+from collections.abc import Awaitable, Callable
+from contextlib import suppress
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any
+
+import aiohttp
+
+from .codex_client import CodexClient, CodexConfig
+from .fake_codex import DELAY_ENV, DELAY_PER_KCHAR_ENV
+from .job_api_client import API_KEY_HEADER
+from .session_logger import SessionLogger
+
+
+@dataclass(slots=True, frozen=True)
+class ReplayEvent:
+    offset: float
+    session_id: str
+    text: str
+
+
+@dataclass(slots=True)
+class ReplayStats:
+    # latencies はキュー待ちを除いた処理時間、end_to_end は投入から完了まで
+    latencies: list[float] = field(default_factory=list)
+    end_to_end: list[float] = field(default_factory=list)
+    queue_waits: list[float] = field(default_factory=list)
+    dispatch_lags: list[float] = field(default_factory=list)
+    errors: int = 0
+    wall_time: float = 0.0
+
+    def summary(self) -> dict[str, Any]:
+        completed = len(self.latencies)
+        return {
+            "requests": completed + self.errors,
+            "errors": self.errors,
+            "wall_time": round(self.wall_time, 3),
+            "throughput_per_s": round(completed / self.wall_time, 3) if self.wall_time else None,
+            "latency": _describe(self.latencies),
+            "end_to_end": _describe(self.end_to_end),
+            "queue_wait": _describe(self.queue_waits),
+            "dispatch_lag": _describe(self.dispatch_lags),
+        }
+
+
+def _describe(samples: list[float]) -> dict[str, float] | None:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+
+    def pct(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 3)
+
+    return {
+        "mean": round(statistics.fmean(ordered), 3),
+        "p50": pct(0.50),
+        "p90": pct(0.90),
+        "p99": pct(0.99),
+        "max": round(ordered[-1], 3),
+    }
+
+
+async def load_events(
+    logger: SessionLogger,
+    *,
+    since: date | None = None,
+    until: date | None = None,
+    limit: int | None = None,
+) -> list[ReplayEvent]:
+    """ログから `input` イベントを読み、最初のイベントからの経過秒付きで返す。"""
+    raw: list[tuple[datetime, str, str]] = []
+    for day in await logger.list_days():
+        if (since and day < since) or (until and day > until):
+            continue
+        for event in await logger.read_events(day):
+            if event.get("stream") != "input":
+                continue
+            try:
+                timestamp = datetime.fromisoformat(event["timestamp"])
+            except (KeyError, TypeError, ValueError):
+                continue
+            raw.append((timestamp, str(event.get("session_id", "")), str(event.get("text", ""))))
+    raw.sort(key=lambda item: item[0])
+    if limit is not None:
+        raw = raw[:limit]
+    if not raw:
+        return []
+    origin = raw[0][0]
+    return [
+        ReplayEvent(offset=(timestamp - origin).total_seconds(), session_id=session_id, text=text)
+        for timestamp, session_id, text in raw
+    ]
+
+
+async def replay(
+    events: list[ReplayEvent],
+    send: Callable[[ReplayEvent], Awaitable[float]],
+    *,
+    speed: float,
+) -> ReplayStats:
+    """イベントを元の間隔 / speed で投入する。send はキュー待ち秒数を返す。"""
+    stats = ReplayStats()
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+
+    async def fire(event: ReplayEvent) -> None:
+        scheduled = started + (event.offset / speed if speed > 0 else 0.0)
+        await asyncio.sleep(max(0.0, scheduled - loop.time()))
+        dispatched = loop.time()
+        stats.dispatch_lags.append(dispatched - scheduled)
+        try:
+            queue_wait = await send(event)
+        except Exception:  # noqa: BLE001
+            stats.errors += 1
+            return
+        elapsed = loop.time() - dispatched
+        stats.end_to_end.append(elapsed)
+        stats.latencies.append(max(0.0, elapsed - queue_wait))
+        stats.queue_waits.append(queue_wait)
+
+    await asyncio.gather(*(fire(event) for event in events))
+    stats.wall_time = loop.time() - started
+    return stats
+
+
+def _fake_codex_command(directory: Path) -> str:
+    """CodexClient から起動できるよう fake_codex を包むシェルスクリプトを作る。"""
+    script = directory / "fake-codex"
+    module = f"{__package__}.fake_codex"
+    script.write_text(f'#!/bin/sh\nexec "{sys.executable}" -m {module} "$@"\n', encoding="utf-8")
+    script.chmod(script.stat().st_mode | stat.S_IXUSR)
+    return str(script)
+
+
+def client_sender(client: CodexClient, concurrency: int) -> Callable[[ReplayEvent], Awaitable[float]]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def send(event: ReplayEvent) -> float:
+        waited_from = time.monotonic()
+        async with semaphore:
+            queue_wait = time.monotonic() - waited_from
+            await client.run(event.text)
+        return queue_wait
+
+    return send
+
+
+def api_sender(
+    http: aiohttp.ClientSession, base_url: str, concurrency: int
+) -> tuple[Callable[[ReplayEvent], Awaitable[float]], Callable[[], Awaitable[None]]]:
+    """ログ上のセッションごとに API セッションを作り、入力を順番に送る。
+
+    キュー待ちは、同じセッションの前の入力の完了と同時実行数の空きを待った時間。
+    2 つ目の戻り値は、作成したセッションを削除する後始末。再生後に必ず呼ぶ。
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    sessions: dict[str, str] = {}
+    ordering: dict[str, asyncio.Lock] = {}
+
+    async def post(path: str, payload: dict[str, Any] | None) -> Any:
+        async with http.post(base_url.rstrip("/") + path, json=payload) as response:
+            response.raise_for_status()
+            return await response.json()
+
+    async def send(event: ReplayEvent) -> float:
+        waited_from = time.monotonic()
+        # asyncio.Lock は到着順に取得されるため、ログ上の順序が保たれる
+        async with ordering.setdefault(event.session_id, asyncio.Lock()):
+            async with semaphore:
+                queue_wait = time.monotonic() - waited_from
+                session_id = sessions.get(event.session_id)
+                if session_id is None:
+                    session_id = (await post("/sessions", None))["session_id"]
+                    sessions[event.session_id] = session_id
+                await post(f"/sessions/{session_id}/input", {"text": event.text})
+        return queue_wait
+
+    async def close() -> None:
+        # 残したセッションは待機中の codex_runner ごと対象サーバーに溜まり、計測を汚す
+        async def delete(session_id: str) -> None:
+            async with semaphore:
+                with suppress(aiohttp.ClientError, asyncio.TimeoutError):
+                    async with http.delete(f"{base_url.rstrip('/')}/sessions/{session_id}"):
+                        pass
+
+        await asyncio.gather(*(delete(session_id) for session_id in sessions.values()))
+        sessions.clear()
+
+    return send, close
+
+
+def _parse_args(argv: list[str] | None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="セッションログの入力を再生する負荷試験ツール")
+    parser.add_argument("--log-dir", type=Path, default=None, help="セッションログのディレクトリ")
+    parser.add_argument("--since", type=date.fromisoformat, default=None)
+    parser.add_argument("--until", type=date.fromisoformat, default=None)
+    parser.add_argument("--limit", type=int, default=None, help="再生するイベント数の上限")
+    parser.add_argument("--speed", type=float, default=1.0, help="到着間隔の圧縮率 (0 で一斉投入)")
+    parser.add_argument("--target", choices=("client", "api"), default="client")
+    parser.add_argument("--concurrency", type=int, default=1, help="同時実行数 (api 対象では同時リクエスト数)")
+    parser.add_argument("--codex-command", default=None, help="client 対象時の Codex コマンド (既定はスタブ)")
+    parser.add_argument("--fake-delay", type=float, default=0.5, help="スタブの応答遅延 (秒)")
+    parser.add_argument("--fake-delay-per-kchar", type=float, default=0.0)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--base-url", default="http://127.0.0.1:5174", help="api 対象時の URL")
+    parser.add_argument("--api-key", default=None, help="api 対象時に X-API-Key として送るキー")
+    return parser.parse_args(argv)
+
+
+async def _run(args: argparse.Namespace) -> dict[str, Any]:
+    logger = SessionLogger(args.log_dir)
+    events = await load_events(logger, since=args.since, until=args.until, limit=args.limit)
+    if not events:
+        return {"requests": 0}
+
+    if args.target == "api":
+        timeout = aiohttp.ClientTimeout(total=args.timeout)
+        # 同時実行数は api_sender のセマフォで制限し、コネクタ側では制限しない
+        connector = aiohttp.TCPConnector(limit=0)
+        headers = {API_KEY_HEADER: args.api_key} if args.api_key else None
+        async with aiohttp.ClientSession(
+            timeout=timeout, connector=connector, headers=headers
+        ) as http:
+            sender, close = api_sender(http, args.base_url, args.concurrency)
+            try:
+                return (await replay(events, sender, speed=args.speed)).summary()
+            finally:
+                await close()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        command = args.codex_command or _fake_codex_command(Path(workdir))
+        os.environ[DELAY_ENV] = str(args.fake_delay)
+        os.environ[DELAY_PER_KCHAR_ENV] = str(args.fake_delay_per_kchar)
+        client = CodexClient(CodexConfig(command=command, workdir=Path(workdir), timeout=args.timeout))
+        stats = await replay(events, client_sender(client, args.concurrency), speed=args.speed)
+    return stats.summary()
+
+
+def main(argv: list[str] | None = None) -> int:
+    summary = asyncio.run(_run(_parse_args(argv)))
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":  # pragma: no cover - CLI entry point
+    sys.exit(main())
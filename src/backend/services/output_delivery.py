@@ -0,0 +1,279 @@
+"""長い Codex 出力を Discord へ届けるための分割・圧縮・保存ユーティリティ。
+
+配信方法は出力の大きさに応じて次の順に選ぶ。
+
+1. 1 通に収まる: そのまま送る
+2. 数通に収まる: コードフェンスと行の境界で分割して送る
+3. アップロード上限に収まる: テキスト添付 (大きければ gzip 圧縮)
+4. それ以上: ローカルの OutputStore に保存し、FastAPI が配信する期限付きリンクを送る
+
+discord.py に依存しないため、API 側からも import できる。
+"""
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import os
+import re
+import secrets
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Literal
+
+FENCE_PATTERN = re.compile(r"^\s*(`{3,}|~{3,})")
+# 分割時にフェンスを閉じる行 ("\n```" など) のために確保しておく文字数
+FENCE_RESERVE = 16
+ATTACHMENT_NAME = "codex-output.txt"
+
+DeliveryKind = Literal["messages", "attachment", "link"]
+
+
+@dataclass(slots=True, frozen=True)
+class Attachment:
+    data: bytes
+    filename: str
+    digest: str
+
+
+@dataclass(slots=True, frozen=True)
+class DeliveryOptions:
+    message_limit: int
+    max_messages: int = 3
+    compress_threshold: int = 1024 * 1024
+    upload_limit: int = 8 * 1024 * 1024
+    store: OutputStore | None = None
+    public_base_url: str | None = None
+    link_ttl: float = 3600.0
+
+
+@dataclass(slots=True, frozen=True)
+class DeliveryPlan:
+    kind: DeliveryKind
+    messages: tuple[str, ...] = ()
+    attachment: Attachment | None = None
+    url: str | None = None
+
+
+def split_message(content: str, limit: int, max_parts: int) -> list[str] | None:
+    """行境界で分割し、コードフェンス内で切れる場合は閉じて次の断片で開き直す。
+
+    `max_parts` 通に収まらなければ None を返す。
+    """
+    parts: list[str] = []
+    buffer: list[str] = []
+    size = 0
+    fence_header: str | None = None
+    fence_marker: str | None = None
+
+    def flush() -> None:
+        text = "\n".join(buffer)
+        if fence_marker is not None:
+            text += "\n" + fence_marker
+        if text.strip():
+            parts.append(text)
+
+    for line in _wrap_long_lines(content.split("\n"), limit - FENCE_RESERVE * 2):
+        added = len(line) + (1 if buffer else 0)
+        if buffer and size + added > limit - FENCE_RESERVE:
+            flush()
+            if len(parts) >= max_parts:
+                return None
+            buffer = [fence_header] if fence_header is not None else []
+            size = len(fence_header) if fence_header is not None else 0
+            added = len(line) + (1 if buffer else 0)
+        buffer.append(line)
+        size += added
+
+        match = FENCE_PATTERN.match(line)
+        if match:
+            marker = match.group(1)
+            if fence_marker is None:
+                fence_header, fence_marker = line.strip(), marker
+            elif marker.startswith(fence_marker[0]) and len(marker) >= len(fence_marker):
+                fence_header, fence_marker = None, None
+
+    if buffer:
+        # 最後の断片は元のテキストどおりにする (閉じられていないフェンスは補わない)
+        text = "\n".join(buffer)
+        if text.strip():
+            parts.append(text)
+    return parts if len(parts) <= max_parts else None
+
+
+def _wrap_long_lines(lines: list[str], width: int) -> list[str]:
+    wrapped: list[str] = []
+    for line in lines:
+        while len(line) > width:
+            wrapped.append(line[:width])
+            line = line[width:]
+        wrapped.append(line)
+    return wrapped
+
+
+def content_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def build_attachment(content: str, compress_threshold: int) -> Attachment:
+    """テキスト添付を作る。compress_threshold バイトを超える場合は gzip 圧縮する。"""
+    raw = content.encode("utf-8")
+    digest = content_digest(raw)
+    if len(raw) > compress_threshold:
+        # mtime=0 で同じ内容から常に同じバイト列を得る
+        return Attachment(gzip.compress(raw, mtime=0), f"{ATTACHMENT_NAME}.gz", digest)
+    return Attachment(raw, ATTACHMENT_NAME, digest)
+
+
+class OutputStore:
+    """内容ハッシュで重複排除して出力を保存し、期限付きリンクを発行する。
+
+    ボットと API サーバーは別プロセスのため、リンク情報もファイルで共有する。
+    保存と削除はプロセス内ではロックで直列化する。別プロセスの prune() とは、
+    リンクを先に書き、削除対象を更新時刻が猶予より古い出力に限ることで競合を避ける。
+    """
+
+    def __init__(self, base_dir: Path) -> None:
+        self._base_dir = base_dir
+        self._lock = threading.Lock()
+
+    def put(self, attachment: Attachment) -> Path:
+        with self._lock:
+            return self._put(attachment)
+
+    def issue_link(self, attachment: Attachment, ttl: float) -> str:
+        """出力を保存し、それに対するトークンを発行する。"""
+        token = secrets.token_urlsafe(18)
+        link = {
+            "digest": attachment.digest,
+            "filename": attachment.filename,
+            "expires_at": time.time() + ttl,
+        }
+        path = self._link_path(token)
+        with self._lock:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(json.dumps(link), encoding="utf-8")
+            self._put(attachment)
+        return token
+
+    def _put(self, attachment: Attachment) -> Path:
+        path = self._blob_path(attachment.digest, attachment.filename)
+        try:
+            # prune() の猶予判定に使うため、既存の出力も更新時刻を進める
+            os.utime(path)
+        except FileNotFoundError:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_name(path.name + ".tmp")
+            tmp_path.write_bytes(attachment.data)
+            tmp_path.replace(path)
+        return path
+
+    def resolve(self, token: str) -> tuple[Path, str] | None:
+        """有効なトークンならファイルパスと配信用ファイル名を返す。"""
+        if not re.fullmatch(r"[A-Za-z0-9_-]+", token):
+            return None
+        path = self._link_path(token)
+        link = self._read_link(path)
+        if link is None:
+            return None
+        if link["expires_at"] < time.time():
+            path.unlink(missing_ok=True)
+            return None
+        blob = self._blob_path(link["digest"], link["filename"])
+        if not blob.exists():
+            return None
+        return blob, link["filename"]
+
+    def prune(self, grace: float = 0.0) -> int:
+        """期限切れ・破損したリンクと、どのリンクからも参照されない出力を削除する。
+
+        参照されない出力でも、更新時刻が grace 秒以内のものは発行途中のリンクに備えて残す。
+        """
+        with self._lock:
+            removed = 0
+            live: set[str] = set()
+            now = time.time()
+            for path in self._base_dir.glob("links/*.json"):
+                link = self._read_link(path)
+                if link is None or link["expires_at"] < now:
+                    path.unlink(missing_ok=True)
+                    removed += 1
+                else:
+                    live.add(link["digest"])
+            for path in self._base_dir.glob("blobs/*"):
+                if path.name.endswith(".tmp") or path.name.split(".", 1)[0] in live:
+                    continue
+                try:
+                    if path.stat().st_mtime > now - grace:
+                        continue
+                except FileNotFoundError:
+                    continue
+                path.unlink(missing_ok=True)
+                removed += 1
+            return removed
+
+    @staticmethod
+    def _read_link(path: Path) -> dict | None:
+        """リンク情報を読む。読めない・項目が欠けている場合は None。"""
+        try:
+            link = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        if not (
+            isinstance(link, dict)
+            and isinstance(link.get("digest"), str)
+            and isinstance(link.get("filename"), str)
+            and isinstance(link.get("expires_at"), (int, float))
+        ):
+            return None
+        return link
+
+    def _blob_path(self, digest: str, filename: str) -> Path:
+        suffix = filename[len(ATTACHMENT_NAME) :] if filename.startswith(ATTACHMENT_NAME) else ""
+        return self._base_dir / "blobs" / f"{digest}.txt{suffix}"
+
+    def _link_path(self, token: str) -> Path:
+        return self._base_dir / "links" / f"{token}.json"
+
+
+def plan_delivery(content: str, options: DeliveryOptions) -> DeliveryPlan:
+    """出力の大きさに応じて配信方法を決める。"""
+    if len(content) <= options.message_limit:
+        return DeliveryPlan(kind="messages", messages=(content,))
+
+    parts = split_message(content, options.message_limit, options.max_messages)
+    if parts is not None:
+        return DeliveryPlan(kind="messages", messages=tuple(parts))
+
+    attachment = build_attachment(content, options.compress_threshold)
+    upload_limit = options.upload_limit
+    if len(attachment.data) <= upload_limit:
+        return DeliveryPlan(kind="attachment", attachment=attachment)
+
+    if options.store is not None and options.public_base_url:
+        options.store.prune(grace=options.link_ttl)
+        token = options.store.issue_link(attachment, options.link_ttl)
+        url = f"{options.public_base_url.rstrip('/')}/outputs/{token}"
+        return DeliveryPlan(kind="link", url=url, attachment=attachment)
+
+    # リンクを発行できない場合は上限に収まるよう末尾を切り詰めて添付する
+    truncated = attachment
+    keep = len(content)
+    while len(truncated.data) > upload_limit and keep > 0:
+        keep = keep * upload_limit // max(len(truncated.data), 1) * 9 // 10
+        truncated = build_attachment(content[:keep] + "\n[truncated]", options.compress_threshold)
+    return DeliveryPlan(kind="attachment", attachment=truncated)
+
+
+__all__ = [
+    "Attachment",
+    "DeliveryOptions",
+    "DeliveryPlan",
+    "OutputStore",
+    "build_attachment",
+    "content_digest",
+    "plan_delivery",
+    "split_message",
+]
@@ -0,0 +1,310 @@
+"""ユーザー・チャンネル・API キー単位のレート制限と CPU 時間クォータ。
+
+制限はどちらもトークンバケットで表す。
+
+- リクエスト数: 容量 `burst`、毎分 `requests_per_minute` 個補充。1 回の実行で 1 個消費する
+- CPU 時間: 容量 `cpu_seconds_per_hour`、1 時間で満タンまで補充。消費量は実行後に
+  分かるため、残量が正の間は受け付け、実行後に使った CPU 秒を差し引く (負になり得る)
+
+状態はメモリ内、または SQLite ファイル (複数のシャードプロセスで共有可能) に保持する。
+時刻は別プロセスとも比較できるよう `time.time()` を使う。
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+import time
+from collections.abc import Callable, Iterator, Mapping, MutableMapping
+from contextlib import AbstractContextManager, contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Literal, Protocol
+
+if TYPE_CHECKING:
+    import sqlite3
+
+logger = logging.getLogger(__name__)
+
+QuotaScope = Literal["user", "channel", "api_key"]
+LimitKind = Literal["requests", "cpu"]
+
+CPU_REFILL_PERIOD = 3600.0
+# この秒数更新のないバケットは満タンに戻っているとみなして削除する
+IDLE_BUCKET_TTL = 6 * 3600.0
+PRUNE_EVERY = 1024
+
+# バケット名 -> (残量, 最終更新時刻)
+BucketState = tuple[float, float]
+
+
+@dataclass(slots=True, frozen=True)
+class QuotaPolicy:
+    """1 つのスコープに適用する制限。None の項目は制限しない。"""
+
+    requests_per_minute: float | None = None
+    burst: int = 1
+    cpu_seconds_per_hour: float | None = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.requests_per_minute is not None or self.cpu_seconds_per_hour is not None
+
+
+@dataclass(slots=True, frozen=True)
+class RateLimitDecision:
+    allowed: bool
+    retry_after: float = 0.0
+    scope: QuotaScope | None = None
+    kind: LimitKind | None = None
+
+
+@dataclass(slots=True, frozen=True)
+class _Bucket:
+    name: str
+    scope: QuotaScope
+    kind: LimitKind
+    capacity: float
+    rate: float  # 1 秒あたりの補充量
+
+    def refill(self, state: BucketState | None, now: float) -> float:
+        if state is None:
+            return self.capacity
+        tokens, updated = state
+        return min(self.capacity, tokens + max(0.0, now - updated) * self.rate)
+
+
+class QuotaState(Protocol):
+    blocking: bool
+
+    def transaction(
+        self, names: list[str]
+    ) -> AbstractContextManager[MutableMapping[str, BucketState]]: ...
+
+    def prune(self, before: float) -> None: ...
+
+
+class InMemoryQuotaState:
+    """プロセス内の dict にバケットを保持する。"""
+
+    blocking = False
+
+    def __init__(self) -> None:
+        self._buckets: dict[str, BucketState] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def transaction(self, names: list[str]) -> Iterator[MutableMapping[str, BucketState]]:
+        with self._lock:
+            yield self._buckets
+
+    def prune(self, before: float) -> None:
+        with self._lock:
+            self._buckets = {
+                name: state for name, state in self._buckets.items() if state[1] >= before
+            }
+
+
+class SqliteQuotaState:
+    """SQLite ファイルにバケットを保持する。`BEGIN IMMEDIATE` でプロセス間の更新を直列化する。"""
+
+    blocking = True
+
+    def __init__(self, path: Path) -> None:
+        # 設定の import 時に読み込まないよう、SQLite は使う場合だけ import する
+        import sqlite3
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn: sqlite3.Connection = sqlite3.connect(
+            path, timeout=5.0, isolation_level=None, check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS buckets ("
+            "name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+        )
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def transaction(self, names: list[str]) -> Iterator[MutableMapping[str, BucketState]]:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                placeholders = ",".join("?" * len(names))
+                rows = self._conn.execute(
+                    f"SELECT name, tokens, updated FROM buckets WHERE name IN ({placeholders})",
+                    names,
+                ).fetchall()
+                buckets = {name: (tokens, updated) for name, tokens, updated in rows}
+                before = dict(buckets)
+                yield buckets
+                changed = [
+                    (name, tokens, updated)
+                    for name, (tokens, updated) in buckets.items()
+                    if before.get(name) != (tokens, updated)
+                ]
+                if changed:
+                    self._conn.executemany(
+                        "INSERT INTO buckets (name, tokens, updated) VALUES (?, ?, ?) "
+                        "ON CONFLICT(name) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+                        changed,
+                    )
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def prune(self, before: float) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM buckets WHERE updated < ?", (before,))
+
+
+class RateLimiter:
+    """スコープごとの QuotaPolicy に従って実行の受け付けを判定する。"""
+
+    def __init__(
+        self,
+        policies: Mapping[QuotaScope, QuotaPolicy],
+        state: QuotaState | None = None,
+        *,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self._policies = {scope: policy for scope, policy in policies.items() if policy.enabled}
+        self._state: QuotaState = state or InMemoryQuotaState()
+        self._clock = clock
+        self._operations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._policies)
+
+    async def acquire(self, subjects: Mapping[QuotaScope, str], cost: int = 1) -> RateLimitDecision:
+        """すべての対象に余裕があれば cost 回分を消費して受け付ける。1 つでも不足なら何も消費しない。"""
+        if not self.enabled:
+            return RateLimitDecision(allowed=True)
+        decision = await self._call(self._acquire, subjects, cost)
+        return decision or RateLimitDecision(allowed=True)
+
+    async def charge_cpu(self, subjects: Mapping[QuotaScope, str], seconds: float) -> None:
+        """実行後に使った CPU 秒を各対象の CPU 予算から差し引く。"""
+        if not self.enabled or seconds <= 0:
+            return
+        await self._call(self._charge_cpu, subjects, seconds)
+
+    async def _call(self, func: Callable[..., Any], *args: Any) -> Any:
+        # 状態の読み書きに失敗しても実行自体は止めない (制限しない側に倒す)
+        try:
+            if self._state.blocking:
+                # SQLite はロック待ちで止まり得るため、イベントループの外で実行する
+                return await asyncio.to_thread(func, *args)
+            return func(*args)
+        except Exception:  # noqa: BLE001
+            logger.exception("rate limiter state access failed")
+            return None
+
+    def _acquire(self, subjects: Mapping[QuotaScope, str], cost: int) -> RateLimitDecision:
+        now = self._clock()
+        buckets = self._buckets(subjects)
+        if not buckets:
+            return RateLimitDecision(allowed=True)
+
+        with self._state.transaction([bucket.name for bucket in buckets]) as state:
+            levels = {bucket.name: bucket.refill(state.get(bucket.name), now) for bucket in buckets}
+            worst: RateLimitDecision | None = None
+            for bucket in buckets:
+                tokens = levels[bucket.name]
+                if bucket.kind == "requests":
+                    # burst を超える一括投入はバケットが満タンなら受け付け、残量を負にする
+                    required = min(float(cost), bucket.capacity)
+                    if tokens < required:
+                        retry_after = (required - tokens) / bucket.rate
+                    else:
+                        continue
+                elif tokens <= 0:
+                    retry_after = -tokens / bucket.rate
+                else:
+                    continue
+                if worst is None or retry_after > worst.retry_after:
+                    worst = RateLimitDecision(
+                        allowed=False, retry_after=retry_after, scope=bucket.scope, kind=bucket.kind
+                    )
+            if worst is not None:
+                return worst
+            for bucket in buckets:
+                consumed = cost if bucket.kind == "requests" else 0
+                state[bucket.name] = (levels[bucket.name] - consumed, now)
+
+        self._maybe_prune(now)
+        return RateLimitDecision(allowed=True)
+
+    def _charge_cpu(self, subjects: Mapping[QuotaScope, str], seconds: float) -> None:
+        now = self._clock()
+        buckets = [bucket for bucket in self._buckets(subjects) if bucket.kind == "cpu"]
+        if not buckets:
+            return
+        with self._state.transaction([bucket.name for bucket in buckets]) as state:
+            for bucket in buckets:
+                state[bucket.name] = (bucket.refill(state.get(bucket.name), now) - seconds, now)
+
+    def _buckets(self, subjects: Mapping[QuotaScope, str]) -> list[_Bucket]:
+        buckets: list[_Bucket] = []
+        for scope, subject in subjects.items():
+            policy = self._policies.get(scope)
+            if policy is None:
+                continue
+            if policy.requests_per_minute is not None:
+                buckets.append(
+                    _Bucket(
+                        name=f"requests:{scope}:{subject}",
+                        scope=scope,
+                        kind="requests",
+                        capacity=float(max(1, policy.burst)),
+                        rate=policy.requests_per_minute / 60.0,
+                    )
+                )
+            if policy.cpu_seconds_per_hour is not None:
+                buckets.append(
+                    _Bucket(
+                        name=f"cpu:{scope}:{subject}",
+                        scope=scope,
+                        kind="cpu",
+                        capacity=policy.cpu_seconds_per_hour,
+                        rate=policy.cpu_seconds_per_hour / CPU_REFILL_PERIOD,
+                    )
+                )
+        return buckets
+
+    def _maybe_prune(self, now: float) -> None:
+        self._operations += 1
+        if self._operations % PRUNE_EVERY == 0:
+            self._state.prune(now - IDLE_BUCKET_TTL)
+
+
+_rate_limiter: RateLimiter | None = None
+
+
+def get_rate_limiter() -> RateLimiter:
+    """DI 用シングルトン。設定の読み込みは初回利用時まで遅延する。"""
+    global _rate_limiter
+    if _rate_limiter is None:
+        from ..core.config import get_settings
+
+        settings = get_settings()
+        state_path = settings.rate_limit_state_path
+        _rate_limiter = RateLimiter(
+            settings.quota_policies(),
+            SqliteQuotaState(state_path) if state_path is not None else InMemoryQuotaState(),
+        )
+    return _rate_limiter
+
+
+__all__ = [
+    "InMemoryQuotaState",
+    "QuotaPolicy",
+    "QuotaScope",
+    "RateLimitDecision",
+    "RateLimiter",
+    "SqliteQuotaState",
+    "get_rate_limiter",
+]
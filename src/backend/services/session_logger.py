@@ -1,24 +1,60 @@
-"""セッションイベントを JSONL へ追記するロガー。"""
+"""セッションイベントを JSONL へ追記するロガー。
+
+当日分は `{YYYY-MM-DD}.jsonl` へ追記し、書き込みが終わった日のファイルは
+`compact()` で gzip 圧縮したセグメント (`.seg.gz`) と索引 (`.idx.json`) に変換する。
+セグメント内では session_id を日ごとの一覧へのインデックスに置き換えて保存する。
+圧縮後に遅れて書かれた行は次回の圧縮で既存セグメントへマージする。
+`read_events()` はどちらの形式も透過的に読み出す。
+
+追記と圧縮はファイルロック (flock) で調停するため、複数プロセスから同じディレクトリへ
+書き込んでも圧縮中の行は失われない。
+"""
 from __future__ import annotations
 
 import asyncio
+import fcntl
+import gzip
+import heapq
 import json
-from datetime import datetime, timezone
+import logging
+import os
+from collections.abc import Iterator
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
 from pathlib import Path
-from typing import Literal
+from typing import Any, Literal
 from uuid import UUID
 
-from ..core.config import settings
+from ..core.config import get_settings
 
 LogStream = Literal["input", "output", "status"]
 
+logger = logging.getLogger(__name__)
+
+JSONL_SUFFIX = ".jsonl"
+SEGMENT_SUFFIX = ".seg.gz"
+INDEX_SUFFIX = ".idx.json"
+# 圧縮処理が引き取った JSONL (圧縮完了で削除。残っていれば中断された圧縮の残り)
+CLAIMED_SUFFIX = ".jsonl.compacting"
+SEGMENT_FORMAT_VERSION = 1
+
+
+@dataclass(slots=True)
+class CompactionReport:
+    compacted_days: int = 0
+    deleted_days: int = 0
+    bytes_before: int = 0
+    bytes_after: int = 0
+
 
 class SessionLogger:
     """セッションの入出力を日次 JSONL へ保存する。"""
 
     def __init__(self, base_dir: Path | None = None) -> None:
-        self._base_dir = base_dir or settings.session_log_dir
+        self._base_dir = base_dir or get_settings().session_log_dir
+        # 追記用。丸 1 日分の圧縮・展開を待たせないよう、圧縮と読み出しは別のロックにする
         self._lock = asyncio.Lock()
+        self._compaction_lock = asyncio.Lock()
 
     async def log_event(self, session_id: UUID, stream: LogStream, text: str) -> None:
         """セッションイベントを追記する。"""
@@ -34,14 +70,261 @@ class SessionLogger:
         async with self._lock:
             await asyncio.to_thread(self._append_line, path, line)
 
+    async def list_days(self) -> list[date]:
+        """ログが存在する日付を昇順で返す。"""
+        return await asyncio.to_thread(self._list_days)
+
+    async def read_events(
+        self, day: date, session_id: UUID | None = None
+    ) -> list[dict[str, Any]]:
+        """指定日のイベントを `log_event` と同じ形の dict で返す。圧縮済みでも透過的に読む。"""
+        async with self._compaction_lock:
+            return await asyncio.to_thread(self._read_day, day, session_id)
+
+    async def compact(
+        self,
+        *,
+        compact_after_days: int = 1,
+        retention_days: int | None = None,
+        today: date | None = None,
+    ) -> CompactionReport:
+        """書き込みの終わった日を圧縮し、保持期間を過ぎた日を削除する。
+
+        `compact_after_days` 日以上前の JSONL をセグメントへ変換する (当日分は対象外)。
+        `retention_days` を指定した場合、それより古い日のログはすべての形式で削除する。
+        """
+        today = today or datetime.now(timezone.utc).date()
+        compact_before = today - timedelta(days=max(1, compact_after_days) - 1)
+        delete_before = today - timedelta(days=retention_days) if retention_days else None
+        report = CompactionReport()
+        for day in await self.list_days():
+            async with self._compaction_lock:
+                if delete_before is not None and day < delete_before:
+                    await asyncio.to_thread(self._delete_day, day)
+                    report.deleted_days += 1
+                elif day < compact_before and (
+                    self._jsonl_path(day).exists() or self._claimed_path(day).exists()
+                ):
+                    before, after = await asyncio.to_thread(self._compact_day, day)
+                    report.compacted_days += 1
+                    report.bytes_before += before
+                    report.bytes_after += after
+        return report
+
+    async def run_compaction(
+        self,
+        interval: float,
+        *,
+        compact_after_days: int = 1,
+        retention_days: int | None = None,
+    ) -> None:
+        """バックグラウンドで定期的に `compact()` を実行する。"""
+        while True:
+            try:
+                report = await self.compact(
+                    compact_after_days=compact_after_days, retention_days=retention_days
+                )
+                if report.compacted_days or report.deleted_days:
+                    logger.info(
+                        "session log compaction: compacted %d day(s) %d -> %d bytes, deleted %d day(s)",
+                        report.compacted_days,
+                        report.bytes_before,
+                        report.bytes_after,
+                        report.deleted_days,
+                    )
+            except Exception:  # noqa: BLE001
+                logger.exception("session log compaction failed")
+            await asyncio.sleep(interval)
+
     def _log_path_for(self, timestamp: datetime) -> Path:
         day = timestamp.strftime("%Y-%m-%d")
-        return self._base_dir / f"{day}.jsonl"
+        return self._base_dir / f"{day}{JSONL_SUFFIX}"
+
+    def _jsonl_path(self, day: date) -> Path:
+        return self._base_dir / f"{day.isoformat()}{JSONL_SUFFIX}"
+
+    def _segment_path(self, day: date) -> Path:
+        return self._base_dir / f"{day.isoformat()}{SEGMENT_SUFFIX}"
+
+    def _index_path(self, day: date) -> Path:
+        return self._base_dir / f"{day.isoformat()}{INDEX_SUFFIX}"
+
+    def _claimed_path(self, day: date) -> Path:
+        return self._base_dir / f"{day.isoformat()}{CLAIMED_SUFFIX}"
 
     def _append_line(self, path: Path, line: str) -> None:
         path.parent.mkdir(parents=True, exist_ok=True)
-        with path.open("a", encoding="utf-8") as file:
-            file.write(line + "\n")
+        while True:
+            with path.open("a", encoding="utf-8") as file:
+                fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+                try:
+                    current = os.stat(path)
+                except FileNotFoundError:
+                    current = None
+                # ロック待ちの間に圧縮処理がファイルを引き取っていたら開き直す
+                if current is not None and os.path.samestat(os.fstat(file.fileno()), current):
+                    file.write(line + "\n")
+                    return
+
+    def _claim_jsonl(self, day: date) -> Path | None:
+        """当日分の JSONL を圧縮用に引き取る。以降の追記は新しい JSONL へ書かれる。"""
+        source = self._jsonl_path(day)
+        claimed = self._claimed_path(day)
+        try:
+            file = source.open("rb")
+        except FileNotFoundError:
+            return claimed if claimed.exists() else None
+        with file:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+            if claimed.exists():
+                # 中断された圧縮の残りがあれば、そこへ追加する
+                with claimed.open("ab") as out:
+                    out.write(file.read())
+                source.unlink()
+            else:
+                os.replace(source, claimed)
+        return claimed
+
+    def _list_days(self) -> list[date]:
+        if not self._base_dir.exists():
+            return []
+        days: set[date] = set()
+        for path in self._base_dir.iterdir():
+            for suffix in (JSONL_SUFFIX, SEGMENT_SUFFIX, CLAIMED_SUFFIX):
+                if path.name.endswith(suffix):
+                    try:
+                        days.add(date.fromisoformat(path.name[: -len(suffix)]))
+                    except ValueError:
+                        continue
+        return sorted(days)
+
+    def _read_day(self, day: date, session_id: UUID | None) -> list[dict[str, Any]]:
+        wanted = str(session_id) if session_id is not None else None
+        events: list[dict[str, Any]] = []
+        # 索引は圧縮完了時に最後に書かれるため、索引があればセグメントは完全
+        index_path = self._index_path(day)
+        if index_path.exists():
+            in_segment = True
+            if wanted is not None:
+                index = json.loads(index_path.read_text(encoding="utf-8"))
+                in_segment = wanted in index.get("sessions", {})
+            if in_segment:
+                events.extend(self._read_segment(self._segment_path(day)))
+        # 圧縮後に遅れて書かれた行と、まだ圧縮し終えていない行
+        late = self._read_jsonl(self._claimed_path(day)) + self._read_jsonl(self._jsonl_path(day))
+        if late:
+            events.extend(late)
+            events.sort(key=lambda event: str(event.get("timestamp", "")))
+        if wanted is not None:
+            events = [event for event in events if event.get("session_id") == wanted]
+        return events
+
+    def _read_jsonl(self, path: Path) -> list[dict[str, Any]]:
+        return list(self._iter_jsonl(path))
+
+    def _iter_jsonl(self, path: Path) -> Iterator[dict[str, Any]]:
+        if not path.exists():
+            return
+        with path.open(encoding="utf-8") as file:
+            for number, line in enumerate(file, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning("skipping malformed session log line %s:%d", path, number)
+
+    def _read_segment(self, path: Path) -> list[dict[str, Any]]:
+        return list(self._iter_segment(path))
+
+    def _iter_segment(self, path: Path) -> Iterator[dict[str, Any]]:
+        with gzip.open(path, "rt", encoding="utf-8") as file:
+            header = json.loads(file.readline())
+            if header.get("format") != SEGMENT_FORMAT_VERSION:
+                raise ValueError(f"unsupported session log segment format: {path}")
+            sessions: list[str] = header["sessions"]
+            for timestamp, session_index, stream, text in map(json.loads, file):
+                yield {
+                    "timestamp": timestamp,
+                    "session_id": sessions[session_index],
+                    "stream": stream,
+                    "text": text,
+                }
+
+    def _iter_day_for_compaction(self, day: date, claimed: Path) -> Iterator[dict[str, Any]]:
+        """既存セグメントと引き取った JSONL を時刻順にマージしながら読む。
+
+        どちらも書き込み順 (= 時刻順) に並んでいるため、全体を読み込んで並べ替える必要はない。
+        """
+        sources: list[Iterator[dict[str, Any]]] = []
+        if self._index_path(day).exists():
+            sources.append(self._iter_segment(self._segment_path(day)))
+        sources.append(self._iter_jsonl(claimed))
+        return heapq.merge(*sources, key=lambda event: str(event.get("timestamp", "")))
+
+    def _compact_day(self, day: date) -> tuple[int, int]:
+        claimed = self._claim_jsonl(day)
+        if claimed is None:
+            return 0, 0
+        bytes_before = claimed.stat().st_size
+        index_path = self._index_path(day)
+        if index_path.exists():
+            # 圧縮済みの日に遅れて行が追記された場合は既存セグメントとマージする
+            previous = json.loads(index_path.read_text(encoding="utf-8"))
+            bytes_before += int(previous.get("bytes_raw", 0))
+        # 大きな出力を含む日でもメモリに載せないよう、1 回目でヘッダーと索引に必要な
+        # セッション一覧だけを集め、2 回目で行を流しながら書き出す
+        records = 0
+        sessions: dict[str, int] = {}
+        summary: dict[str, dict[str, Any]] = {}
+        for event in self._iter_day_for_compaction(day, claimed):
+            records += 1
+            session = str(event.get("session_id", ""))
+            sessions.setdefault(session, len(sessions))
+            entry = summary.setdefault(
+                session, {"count": 0, "first": event.get("timestamp"), "last": None}
+            )
+            entry["count"] += 1
+            entry["last"] = event.get("timestamp")
+
+        segment = self._segment_path(day)
+        tmp_segment = segment.with_name(segment.name + ".tmp")
+        with gzip.open(tmp_segment, "wt", encoding="utf-8") as file:
+            header = {"format": SEGMENT_FORMAT_VERSION, "day": day.isoformat(), "sessions": list(sessions)}
+            file.write(json.dumps(header, ensure_ascii=False) + "\n")
+            for event in self._iter_day_for_compaction(day, claimed):
+                row = [
+                    event.get("timestamp"),
+                    sessions[str(event.get("session_id", ""))],
+                    event.get("stream"),
+                    event.get("text", ""),
+                ]
+                file.write(json.dumps(row, ensure_ascii=False) + "\n")
+        os.replace(tmp_segment, segment)
+
+        bytes_after = segment.stat().st_size
+        index = {
+            "format": SEGMENT_FORMAT_VERSION,
+            "day": day.isoformat(),
+            "records": records,
+            "bytes_raw": bytes_before,
+            "bytes_compressed": bytes_after,
+            "sessions": summary,
+        }
+        tmp_index = index_path.with_name(index_path.name + ".tmp")
+        tmp_index.write_text(json.dumps(index, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp_index, index_path)
+        claimed.unlink()
+        return bytes_before, bytes_after
+
+    def _delete_day(self, day: date) -> None:
+        for path in (
+            self._jsonl_path(day),
+            self._claimed_path(day),
+            self._segment_path(day),
+            self._index_path(day),
+        ):
+            path.unlink(missing_ok=True)
 
 
 _session_logger: SessionLogger | None = None
@@ -55,4 +338,4 @@ def get_session_logger() -> SessionLogger:
     return _session_logger
 
 
-__all__ = ["SessionLogger", "get_session_logger"]
+__all__ = ["CompactionReport", "SessionLogger", "get_session_logger"]